@@ -12,6 +12,7 @@ Now you can use the dataset class by specifying flag '--dataset_mode dummy'.
 See our template dataset class 'template_dataset.py' for more details.
 """
 import importlib
+import torch
 import torch.utils.data
 from data.base_dataset import BaseDataset
 from util.util import get_user_attributes
@@ -82,11 +83,37 @@ class CustomDatasetDataLoader:
         self.bs = opt.batch_size
 
         print("dataset [%s] was created" % type(self.dataset).__name__)
-        self.dataloader = torch.utils.data.DataLoader(
-            self.dataset,
-            batch_size=self.bs,  # Load all data for training D and G once together.
-            shuffle=not opt.serial_batches,
-            num_workers=int(opt.num_threads))
+        collate_fn = getattr(self.dataset, 'collate_fn', None)  # datasets may transform whole batches
+        batch_sampler = None
+        if hasattr(self.dataset, 'get_batch_sampler'):  # datasets may read whole batches at once
+            batch_sampler = self.dataset.get_batch_sampler(self.bs, shuffle=not opt.serial_batches,
+                                                           infinite=opt.data_stream)
+        if opt.data_stream:
+            # one endless pass over the data: workers are never respawned and no epoch tail is dropped
+            if batch_sampler is not None:
+                sampling = {'batch_sampler': batch_sampler}
+            else:
+                self.sampler = InfiniteSampler(self.dataset, shuffle=not opt.serial_batches)
+                sampling = {'batch_size': self.bs, 'sampler': self.sampler, 'drop_last': True}
+            self.dataloader = torch.utils.data.DataLoader(
+                self.dataset,
+                num_workers=int(opt.num_threads),
+                pin_memory=torch.cuda.is_available(),
+                collate_fn=collate_fn,
+                **sampling,
+                **({'persistent_workers': True, 'prefetch_factor': opt.prefetch_depth} if opt.num_threads > 0 else {}))
+            self.stream = None
+        else:
+            if batch_sampler is not None:
+                sampling = {'batch_sampler': batch_sampler}
+            else:
+                sampling = {'batch_size': self.bs,  # Load all data for training D and G once together.
+                            'shuffle': not opt.serial_batches}
+            self.dataloader = torch.utils.data.DataLoader(
+                self.dataset,
+                num_workers=int(opt.num_threads),
+                collate_fn=collate_fn,
+                **sampling)
 
     def load_data(self):
         return self
@@ -98,7 +125,94 @@ class CustomDatasetDataLoader:
 
     def __iter__(self):
         """Return a batch of data"""
+        if self.opt.data_stream:
+            # an epoch is len(dataset) / batch_size batches of the endless stream
+            if self.stream is None:
+                self.stream = DevicePrefetcher(iter(self.dataloader), self.opt.gpu_ids)
+            for _ in range(max(len(self) // self.bs, 1)):
+                yield next(self.stream)
+            return
         for i, data in enumerate(self.dataloader):
             if (i + 1) * self.bs >= self.data_size:
                 break
             yield data
+
+
+class InfiniteSampler(torch.utils.data.Sampler):
+    """Sampler yielding dataset indices forever, reshuffled at every pass over the data
+
+    The position in the current pass is kept across the virtual epochs of the training loop.
+    """
+
+    def __init__(self, data_source, shuffle=True, seed=0):
+        self.num_samples = len(data_source)
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def __iter__(self):
+        while True:
+            if self.shuffle:
+                generator = torch.Generator().manual_seed(self.seed + self.epoch)
+                order = torch.randperm(self.num_samples, generator=generator).tolist()
+            else:
+                order = range(self.num_samples)
+            yield from order
+            self.epoch += 1
+
+
+class DevicePrefetcher:
+    """Stage the next batch on the GPU while the current training step runs
+
+    The loader already returns pinned batches (pin_memory), which are copied on a side CUDA stream
+    into device buffers that are allocated once and reused: two slots alternate, one for the current step
+    and one being filled. A slot keeps its source batch alive until the copy is done.
+    Without a GPU, batches are returned as they come from the loader workers.
+    """
+
+    def __init__(self, batches, gpu_ids, num_slots=2):
+        self.batches = batches
+        self.device = torch.device('cuda:{}'.format(gpu_ids[0])) if gpu_ids else None
+        if self.device is None:
+            return
+        self.stream = torch.cuda.Stream(self.device)
+        self.slots = [{'source': None, 'device': {}, 'copied': None} for _ in range(num_slots)]
+        self.slot = 0
+        self.next_batch = self._stage(next(self.batches))
+
+    @staticmethod
+    def _buffer(buffers, key, value, **kwargs):
+        if key not in buffers or buffers[key].shape != value.shape or buffers[key].dtype != value.dtype:
+            buffers[key] = torch.empty(value.shape, dtype=value.dtype, **kwargs)
+        return buffers[key]
+
+    def _stage(self, batch):
+        slot = self.slots[self.slot]
+        self.slot = (self.slot + 1) % len(self.slots)
+        # the slot was last read by the step before the current one, which the side stream waits for
+        self.stream.wait_stream(torch.cuda.current_stream(self.device))
+        if slot['copied'] is not None:
+            slot['copied'].synchronize()  # the previous source batch is free once its copy is done
+        slot['source'] = batch
+        staged = {}
+        with torch.cuda.stream(self.stream):
+            for key, value in batch.items():
+                if not isinstance(value, torch.Tensor):
+                    staged[key] = value
+                    continue
+                staged[key] = self._buffer(slot['device'], key, value, device=self.device)
+                staged[key].copy_(value, non_blocking=True)
+            slot['copied'] = torch.cuda.Event()
+            slot['copied'].record(self.stream)
+        return staged
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.device is None:
+            return next(self.batches)
+        torch.cuda.current_stream(self.device).wait_stream(self.stream)
+        batch = self.next_batch
+        self.next_batch = self._stage(next(self.batches))
+        return batch
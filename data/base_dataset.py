@@ -5,6 +5,8 @@ It also includes common transformation functions
 """
 import random
 import numpy as np
+import torch
+import torch.nn.functional as F
 import torch.utils.data as data
 from PIL import Image
 import torchvision.transforms as transforms
@@ -111,6 +113,43 @@ def get_transform(opt, params=None, grayscale=False, method=Image.BICUBIC, conve
     return transforms.Compose(transform_list)
 
 
+def get_batch_transform(opt):
+    """Return the tensor counterpart of get_transform, applied to a whole uint8 NCHW batch at once.
+
+    It supports the resize / scale_width, crop, none and flip steps of get_transform and maps [0, 255] to [-1, 1];
+    crop offsets and flips are drawn independently for every image.
+    """
+    def resize(images, h, w):
+        if images.shape[2:] == (h, w):
+            return images
+        return F.interpolate(images, size=(h, w), mode='bicubic', align_corners=False)
+
+    def transform(images):
+        images = images.float()
+        h, w = images.shape[2], images.shape[3]
+        if 'resize' in opt.preprocess:
+            images = resize(images, opt.load_size, opt.load_size)
+        elif 'scale_width' in opt.preprocess:
+            images = resize(images, int(opt.load_size * h / w), opt.load_size)
+        if 'crop' in opt.preprocess:
+            n, h, w = images.shape[0], images.shape[2], images.shape[3]
+            if h < opt.crop_size or w < opt.crop_size:
+                raise ValueError('images of size %dx%d are smaller than the crop size %d' % (h, w, opt.crop_size))
+            if h > opt.crop_size or w > opt.crop_size:
+                offsets = torch.arange(opt.crop_size)
+                rows = torch.randint(0, h - opt.crop_size + 1, (n, 1)) + offsets
+                cols = torch.randint(0, w - opt.crop_size + 1, (n, 1)) + offsets
+                images = images[torch.arange(n)[:, None, None], :, rows[:, :, None], cols[:, None, :]]
+                images = images.permute(0, 3, 1, 2)  # advanced indexing moved the channels last
+        if opt.preprocess == 'none':
+            images = resize(images, int(round(h / 4) * 4), int(round(w / 4) * 4))  # as __make_power_2
+        if not opt.no_flip:
+            flip = torch.rand(images.shape[0]) < 0.5
+            images = torch.where(flip[:, None, None, None], images.flip(3), images)
+        return (images / 127.5 - 1).clamp(-1, 1).contiguous()
+    return transform
+
+
 def __make_power_2(img, base, method=Image.BICUBIC):
     ow, oh = img.size
     h = int(round(oh / base) * base)
@@ -0,0 +1,81 @@
+"""Tensor-native CIFAR dataset
+
+CIFAR-10/100 is kept in memory as a single uint8 tensor. It is read and checksummed
+through torchvision only once, then cached as .npy files next to the download.
+Batches are gathered with one indexing operation and augmented as a whole by collate_fn,
+so no PIL image or per-sample transform is involved.
+"""
+import os
+
+import numpy as np
+import torch
+
+from data.base_dataset import BaseDataset, get_batch_transform
+
+
+class CifarTensorDataset(BaseDataset):
+    """CIFAR-10/100 as one uint8 tensor with vectorized batch augmentation."""
+
+    @staticmethod
+    def modify_commandline_options(parser, is_train):
+        """Add new dataset-specific options, and rewrite default values for existing options.
+
+        Parameters:
+            parser          -- original option parser
+            is_train (bool) -- whether training phase or test phase.
+
+        Returns:
+            the modified parser.
+        """
+        parser.add_argument('--download_root', type=str, default='./datasets',
+                            help='root directory of dataset exist or will be saved')
+        parser.add_argument('--dataset_name', type=str, default='CIFAR10',
+                            help='name of imported dataset. CIFAR10 | CIFAR100')
+        return parser
+
+    def __init__(self, opt):
+        """Initialize this dataset class.
+
+        Parameters:
+            opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
+        """
+        BaseDataset.__init__(self, opt)
+        if opt.dataset_name not in ['CIFAR10', 'CIFAR100']:
+            raise ValueError('cifar_tensor dataset supports CIFAR10 | CIFAR100, got %s' % opt.dataset_name)
+        images_path = os.path.join(opt.download_root, '%s_train_images.npy' % opt.dataset_name.lower())
+        labels_path = os.path.join(opt.download_root, '%s_train_labels.npy' % opt.dataset_name.lower())
+        if not (os.path.exists(images_path) and os.path.exists(labels_path)):
+            self.cache_arrays(opt.dataset_name, opt.download_root, images_path, labels_path)
+        self.images = torch.from_numpy(np.load(images_path))  # shape: (N, 3, 32, 32), uint8
+        self.labels = torch.from_numpy(np.load(labels_path))
+        self.transform = get_batch_transform(opt)
+
+    @staticmethod
+    def cache_arrays(dataset_name, root, images_path, labels_path):
+        """Download and verify the dataset with torchvision, then save it as NCHW uint8 .npy files"""
+        if dataset_name == 'CIFAR10':
+            from torchvision.datasets import CIFAR10 as torchvisionlib
+        else:
+            from torchvision.datasets import CIFAR100 as torchvisionlib
+        dataload = torchvisionlib(root=root, download=True)
+        np.save(labels_path, np.asarray(dataload.targets, dtype=np.int64))
+        np.save(images_path, np.ascontiguousarray(dataload.data.transpose(0, 3, 1, 2)))  # NHWC -> NCHW
+
+    def __getitem__(self, index):
+        """Return an un-augmented uint8 image and its label; collate_fn augments and normalizes batches."""
+        return {'data': self.images[index], 'condition': self.labels[index]}
+
+    def __getitems__(self, indices):
+        """Gather a whole batch with one indexing operation (used by the DataLoader when available)."""
+        indices = torch.as_tensor(indices)
+        return {'data': self.images[indices], 'condition': self.labels[indices]}
+
+    def collate_fn(self, batch):
+        """Stack a batch if needed, then augment and normalize it with tensor ops."""
+        if isinstance(batch, list):
+            batch = {key: torch.stack([item[key] for item in batch]) for key in batch[0]}
+        return {'data': self.transform(batch['data']), 'condition': batch['condition']}
+
+    def __len__(self):
+        """Return the total number of images."""
+        return len(self.images)
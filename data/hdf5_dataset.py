@@ -1,7 +1,8 @@
-from data.base_dataset import BaseDataset, get_transform
+from data.base_dataset import BaseDataset, get_batch_transform
 import h5py as h5
+import numpy as np
 import os
-from PIL import Image
+import torch
 
 
 class Hdf5Dataset(BaseDataset):
@@ -32,6 +33,8 @@ class Hdf5Dataset(BaseDataset):
         self.load_in_mem = opt.load_in_mem
         self.imkey = None
         self.lkey = None
+        self.file = None  # opened lazily, once per data loading process
+        self.file_pid = None
 
         with h5.File(self.hdf5_path, 'r') as f:
             key_list = list(f.keys())
@@ -39,6 +42,7 @@ class Hdf5Dataset(BaseDataset):
                 if key == 'data' or key == 'imgs':
                     self.imkey = key
                     self.num_imgs = len(f[self.imkey])
+                    self.chunk_rows = f[self.imkey].chunks[0] if f[self.imkey].chunks else 1
                 elif key == 'label' or key == 'labels':
                     self.lkey = key
                 else:
@@ -50,8 +54,32 @@ class Hdf5Dataset(BaseDataset):
                 self.data = f[self.imkey][:]
                 self.labels = f[self.lkey][:] if (self.lkey is not None) else None
 
-        # define the default transform function.
-        self.transform = get_transform(opt)
+        # define the default transform function, applied to whole batches
+        self.transform = get_batch_transform(opt)
+
+    def _file(self):
+        """Return the HDF5 file handle of this process; forked loader workers open their own."""
+        if self.file is None or self.file_pid != os.getpid():
+            self.file = h5.File(self.hdf5_path, 'r')
+            self.file_pid = os.getpid()
+        return self.file
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['file'] = state['file_pid'] = None  # file handles do not cross process boundaries
+        return state
+
+    def _read(self, key, indices):
+        """Read rows of a dataset: one hyperslab for a contiguous range, a sorted selection otherwise."""
+        if self.load_in_mem:
+            return (self.data if key == self.imkey else self.labels)[indices]
+        data = self._file()[key]
+        if np.all(np.diff(indices) == 1):
+            return data[indices[0]:indices[-1] + 1]
+        order = np.argsort(indices)
+        rows = np.empty((len(indices),) + data.shape[1:], dtype=data.dtype)
+        rows[order] = data[np.asarray(indices)[order]]  # h5py needs increasing indices
+        return rows
 
     def __getitem__(self, index):
         """Return a data point and its metadata information.
@@ -61,22 +89,77 @@ class Hdf5Dataset(BaseDataset):
 
         Returns:
             a dictionary of data with their names. It usually contains the data itself and its metadata information.
-
+            The image is an un-normalized uint8 CHW tensor; collate_fn transforms batches of them.
         """
-        if self.load_in_mem:
-            img = self.data[index]
-            label = self.labels[index] if (self.lkey is not None) else -1
+        batch = self.__getitems__([index])
+        return {'data': batch['data'][0], 'condition': batch['condition'][0]}
+
+    def __getitems__(self, indices):
+        """Read a batch of uint8 NCHW images and their labels (used by the DataLoader when available)."""
+        indices = np.asarray(indices)
+        imgs = torch.from_numpy(self._read(self.imkey, indices))
+        if imgs.shape[1] > 3:  # stored as NHWC
+            imgs = imgs.permute(0, 3, 1, 2)
+        if self.lkey is not None:
+            labels = torch.from_numpy(np.asarray(self._read(self.lkey, indices))).long()
         else:
-            with h5.File(self.hdf5_path, 'r') as f:
-                img = f[self.imkey][index]
-                label = f[self.lkey][index] if (self.lkey is not None) else -1
-        if img.shape[0] <= 3:
-            img = img.transpose(1, 2, 0)
-        img = Image.fromarray(img)
-        img = self.transform(img)
+            labels = torch.full((len(indices),), -1, dtype=torch.long)
+        return {'data': imgs.contiguous(), 'condition': labels}
+
+    def collate_fn(self, batch):
+        """Stack a batch if needed, then augment and normalize it with tensor ops."""
+        if isinstance(batch, list):
+            batch = {key: torch.stack([item[key] for item in batch]) for key in batch[0]}
+        return {'data': self.transform(batch['data']), 'condition': batch['condition']}
 
-        return {'data': img, 'condition': label}
+    def get_batch_sampler(self, batch_size, shuffle=True, infinite=False):
+        return ContiguousBatchSampler(self.num_imgs, batch_size, self.chunk_rows, shuffle, infinite)
 
     def __len__(self):
         """Return the total number of images."""
         return self.num_imgs
+
+
+class ContiguousBatchSampler(torch.utils.data.Sampler):
+    """Batch sampler whose batches are runs of consecutive indices, so that each batch is one HDF5 hyperslab read
+    (two for the batch that wraps around the end of the data).
+
+    At every pass over the data the index range is rotated by a random offset (in whole chunks)
+    and cut into consecutive batches, which are visited in a random order.
+    The rotation moves the batch boundaries between passes, so every row is drawn once per pass
+    and the rows sharing a batch change; with drop_last, the rows of the incomplete last batch
+    (a different run at every pass) are skipped.
+    """
+
+    def __init__(self, num_samples, batch_size, chunk_rows=1, shuffle=True, infinite=False, seed=0,
+                 drop_last=True):
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.chunk_rows = max(chunk_rows, 1)
+        self.shuffle = shuffle
+        self.infinite = infinite
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def __len__(self):
+        if self.drop_last:
+            return self.num_samples // self.batch_size
+        return -(-self.num_samples // self.batch_size)
+
+    def __iter__(self):
+        while True:
+            generator = torch.Generator().manual_seed(self.seed + self.epoch)
+            offset = 0
+            if self.shuffle:
+                num_chunks = -(-self.num_samples // self.chunk_rows)
+                offset = torch.randint(0, num_chunks, (1,), generator=generator).item() * self.chunk_rows
+            starts = torch.arange(len(self)) * self.batch_size
+            if self.shuffle:
+                starts = starts[torch.randperm(len(starts), generator=generator)]
+            for start in starts.tolist():
+                end = min(start + self.batch_size, self.num_samples)
+                yield [(offset + i) % self.num_samples for i in range(start, end)]
+            self.epoch += 1
+            if not self.infinite:
+                return
@@ -8,6 +8,7 @@ so that this class can load images from both current directory and its subdirect
 import torch.utils.data as data
 
 from PIL import Image
+import numpy as np
 import os
 import os.path
 
@@ -21,20 +22,63 @@ def is_image_file(filename):
     return any(filename.endswith(extension) for extension in IMG_EXTENSIONS)
 
 
-def make_dataset(dir, max_dataset_size=float("inf")):
-    images = []
-    assert os.path.isdir(dir), '%s is not a valid directory' % dir
+def make_dataset(dir, max_dataset_size=float("inf"), index_filename=None):
+    """Return the image paths under dir.
 
-    for root, _, fnames in sorted(os.walk(dir)):
-        for fname in fnames:
-            if is_image_file(fname):
-                path = os.path.join(root, fname)
-                images.append(path)
+    With index_filename, the walk is saved to (and later loaded from) that npz file,
+    so that large folders are walked once. The index records the mtime of every walked directory,
+    adding or removing a file or a subdirectory anywhere under dir rebuilds it.
+    The index file must be outside dir, or writing it would modify dir.
+    """
+    images = None
+    assert os.path.isdir(dir), '%s is not a valid directory' % dir
+    root = os.path.abspath(dir)
+    if index_filename and os.path.commonpath([root, os.path.abspath(index_filename)]) == root:
+        raise ValueError('the index file %s must not be inside %s' % (index_filename, dir))
+    if index_filename and os.path.exists(index_filename):
+        index = np.load(index_filename)
+        if str(index['root']) == root and index['mtimes'].tolist() == get_mtimes(dir, index['dirs'].tolist()):
+            print('Loading pre-saved Index file %s...' % index_filename)
+            images = [os.path.join(dir, path) for path in index['imgs'].tolist()]
+
+    if images is None:
+        images, dirs = [], []
+        for walked_dir, _, fnames in sorted(os.walk(dir)):
+            dirs.append(os.path.relpath(walked_dir, dir))
+            for fname in fnames:
+                if is_image_file(fname):
+                    path = os.path.join(walked_dir, fname)
+                    images.append(path)
+        if index_filename:
+            print('Generating Index file %s...' % index_filename)
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(index_filename)), exist_ok=True)
+                np.savez_compressed(index_filename, root=root, dirs=np.array(dirs),
+                                    mtimes=np.array(get_mtimes(dir, dirs), dtype=np.float64),
+                                    imgs=np.array([os.path.relpath(path, dir) for path in images]))
+            except OSError as e:  # e.g. a read-only cache location
+                print('Could not save the index file: %s' % e)
     return images[:min(max_dataset_size, len(images))]
 
 
-def default_loader(path):
-    return Image.open(path).convert('RGB')
+def get_mtimes(dir, subdirs):
+    """Return the mtime of every subdirectory of dir, None for the missing ones"""
+    mtimes = []
+    for subdir in subdirs:
+        try:
+            mtimes.append(os.stat(os.path.join(dir, subdir)).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def default_loader(path, draft_size=None):
+    """Load an RGB image; with draft_size, JPEGs are decoded at the smallest scale (1, 1/2, 1/4 or 1/8)
+    that is still at least draft_size x draft_size, which is much faster than a full decode then a resize."""
+    img = Image.open(path)
+    if draft_size is not None:
+        img.draft('RGB', (draft_size, draft_size))
+    return img.convert('RGB')
 
 
 class ImageFolder(data.Dataset):
@@ -0,0 +1,146 @@
+"""Pack an image folder into one uint8 array file
+
+Images are decoded by a pool of processes, center-cropped to a square, resized to --load_size,
+and written in NCHW order as a chunked HDF5 file ('imgs' and 'labels', the layout expected by
+'--dataset_mode hdf5') or as raw .npy files that can be memory-mapped with np.load(mmap_mode='r').
+Labels are the indices of the top-level sub-directories, or 0 for a folder without sub-directories;
+a folder mixing both layouts is rejected. HDF5 chunks hold at most about 1 MB of images,
+so that a random read decompresses little more than its image and fits the default chunk cache.
+Progress is saved after every write, so an interrupted pack resumes where it stopped.
+
+Example:
+    python -m data.pack_image_folder --dataroot ./datasets/celeba/img_align_celeba \
+           --output ./datasets/celeba/img_align_celeba_128.hdf5 --load_size 128
+"""
+import os
+import time
+from argparse import ArgumentParser
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+from data.image_folder import make_dataset
+
+
+def prepare_parser():
+    usage = 'Pack an image folder into a chunked uint8 HDF5 or .npy file.'
+    parser = ArgumentParser(description=usage)
+    parser.add_argument('--dataroot', type=str, required=True, help='image folder to pack')
+    parser.add_argument('--output', type=str, required=True,
+                        help='output file, .hdf5 for HDF5, .npy for images (labels go to <name>_labels.npy)')
+    parser.add_argument('--load_size', type=int, default=128, help='side of the packed square images')
+    parser.add_argument('--chunk_size', type=int, default=500, help='# images decoded per write')
+    parser.add_argument('--num_workers', type=int, default=8, help='# decoding processes')
+    parser.add_argument('--compression', type=str, default=None, help='HDF5 compression filter, e.g. lzf')
+    return parser
+
+
+def load_image(args):
+    """decode an image, center-crop it to a square and resize it to load_size, as CHW uint8"""
+    path, load_size = args
+    img = Image.open(path).convert('RGB')
+    w, h = img.size
+    side = min(w, h)
+    left, top = (w - side) // 2, (h - side) // 2
+    img = img.crop((left, top, left + side, top + side)).resize((load_size, load_size), Image.BICUBIC)
+    return np.asarray(img, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def get_labels(root, paths):
+    relpaths = [os.path.relpath(path, root) for path in paths]
+    classes = sorted({relpath.split(os.sep)[0] for relpath in relpaths if os.sep in relpath})
+    if not classes:
+        return np.zeros(len(paths), dtype=np.int64)
+    if any(os.sep not in relpath for relpath in relpaths):
+        raise ValueError('%s holds both images and class sub-directories, '
+                         'move the top-level images into a sub-directory' % root)
+    class_to_idx = {name: i for i, name in enumerate(classes)}
+    return np.array([class_to_idx[relpath.split(os.sep)[0]] for relpath in relpaths], dtype=np.int64)
+
+
+class Hdf5Writer:
+    """'imgs' / 'labels' datasets in an HDF5 file, the number of packed images is the 'num_packed' attribute"""
+
+    def __init__(self, output, num_images, load_size, chunk_size, labels, compression=None):
+        import h5py as h5
+        self.file = h5.File(output, 'a')
+        if 'imgs' not in self.file:
+            # chunks of at most 1 MB (h5py's default chunk cache), independent of the write size
+            chunk_rows = max(1, min(num_images, 2 ** 20 // (3 * load_size * load_size)))
+            self.file.create_dataset('imgs', (num_images, 3, load_size, load_size), dtype='uint8',
+                                     chunks=(chunk_rows, 3, load_size, load_size), compression=compression)
+            self.file.create_dataset('labels', data=labels)
+            self.file.attrs['num_packed'] = 0
+        if self.file['imgs'].shape != (num_images, 3, load_size, load_size):
+            raise ValueError('%s holds a pack of another folder or size: %s' % (output, self.file['imgs'].shape))
+        self.num_packed = int(self.file.attrs['num_packed'])
+
+    def write(self, start, imgs):
+        self.file['imgs'][start:start + len(imgs)] = imgs
+        self.file.attrs['num_packed'] = start + len(imgs)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class NpyWriter:
+    """memory-mapped .npy images and labels, the number of packed images is kept in <output>.progress"""
+
+    def __init__(self, output, num_images, load_size, chunk_size, labels, compression=None):
+        self.progress_path = output + '.progress'
+        shape = (num_images, 3, load_size, load_size)
+        if os.path.exists(output) and os.path.exists(self.progress_path):
+            self.imgs = np.load(output, mmap_mode='r+')
+            if self.imgs.shape != shape:
+                raise ValueError('%s holds a pack of another folder or size: %s' % (output, self.imgs.shape))
+            with open(self.progress_path) as f:
+                self.num_packed = int(f.read())
+        else:
+            self.imgs = np.lib.format.open_memmap(output, mode='w+', dtype=np.uint8, shape=shape)
+            np.save(output[:-len('.npy')] + '_labels.npy', labels)
+            self.num_packed = 0
+
+    def write(self, start, imgs):
+        self.imgs[start:start + len(imgs)] = imgs
+        self.imgs.flush()
+        with open(self.progress_path, 'w') as f:
+            f.write(str(start + len(imgs)))
+
+    def close(self):
+        del self.imgs
+
+
+def run(config):
+    paths = sorted(make_dataset(config['dataroot']))  # sorted, so that a resumed pack sees the same order
+    labels = get_labels(config['dataroot'], paths)
+    writer_class = NpyWriter if config['output'].endswith('.npy') else Hdf5Writer
+    writer = writer_class(config['output'], len(paths), config['load_size'], config['chunk_size'], labels,
+                          config['compression'])
+    start = writer.num_packed
+    if start > 0:
+        print('Resuming the pack of %s at %d / %d images' % (config['dataroot'], start, len(paths)))
+
+    start_time = time.time()
+    with Pool(config['num_workers']) as pool:
+        images = pool.imap(load_image, [(path, config['load_size']) for path in paths[start:]], chunksize=16)
+        for chunk_start in range(start, len(paths), config['chunk_size']):
+            chunk_end = min(chunk_start + config['chunk_size'], len(paths))
+            writer.write(chunk_start, np.stack([next(images) for _ in range(chunk_start, chunk_end)]))
+            images_per_second = (chunk_end - start) / (time.time() - start_time)
+            print('\r%d / %d images, %.1f images / s' % (chunk_end, len(paths), images_per_second), end='')
+    writer.close()
+    print('\nPacked %d images into %s' % (len(paths), config['output']))
+
+
+def main():
+    # parse command line
+    parser = prepare_parser()
+    config = vars(parser.parse_args())
+    print(config)
+    run(config)
+
+
+if __name__ == '__main__':
+    main()
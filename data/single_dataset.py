@@ -1,6 +1,8 @@
+import hashlib
+import os
+
 from data.base_dataset import BaseDataset, get_transform
-from data.image_folder import make_dataset
-from PIL import Image
+from data.image_folder import make_dataset, default_loader
 
 
 class SingleDataset(BaseDataset):
@@ -9,6 +11,14 @@ class SingleDataset(BaseDataset):
     It can be used for generating CycleGAN results only for one side with the model option '-model test'.
     """
 
+    @staticmethod
+    def modify_commandline_options(parser, is_train):
+        parser.add_argument('--index_filename', type=str, default=None,
+                            help='file caching the list of images, '
+                                 'default: ~/.cache/image_index/<hash of dataroot>.npz; '
+                                 'empty to walk the folder every time')
+        return parser
+
     def __init__(self, opt):
         """Initialize this dataset class.
 
@@ -16,8 +26,14 @@ class SingleDataset(BaseDataset):
             opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
         """
         BaseDataset.__init__(self, opt)
-        self.A_paths = sorted(make_dataset(opt.dataroot, opt.max_dataset_size))
+        index_filename = opt.index_filename
+        if index_filename is None:
+            key = hashlib.sha1(os.path.abspath(opt.dataroot).encode()).hexdigest()
+            index_filename = os.path.join(os.path.expanduser('~'), '.cache', 'image_index', key + '.npz')
+        self.A_paths = sorted(make_dataset(opt.dataroot, opt.max_dataset_size, index_filename or None))
         self.transform = get_transform(opt, grayscale=(self.opt.input_nc == 1))
+        # images are resized to load_size anyway, so JPEGs can be decoded near that size
+        self.draft_size = opt.load_size if ('resize' in opt.preprocess or 'scale_width' in opt.preprocess) else None
 
     def __getitem__(self, index):
         """Return a data point and its metadata information.
@@ -30,7 +46,7 @@ class SingleDataset(BaseDataset):
             A_paths(str) - - the path of the image
         """
         A_path = self.A_paths[index]
-        A_img = Image.open(A_path).convert('RGB')
+        A_img = default_loader(A_path, self.draft_size)
         A = self.transform(A_img)
         return {'A': A, 'A_paths': A_path}
 
@@ -0,0 +1,120 @@
+from itertools import islice
+from unittest import TestCase
+
+from data import InfiniteSampler
+
+
+class InfiniteSamplerTestCase(TestCase):
+
+    def test_passes_cover_the_data(self):
+        sampler = InfiniteSampler(range(10), shuffle=True)
+        indices = list(islice(iter(sampler), 30))
+        for i in range(3):
+            self.assertEqual(sorted(indices[i * 10:(i + 1) * 10]), list(range(10)))
+        self.assertNotEqual(indices[:10], indices[10:20])
+        self.assertEqual(sampler.epoch, 2)
+
+
+class BatchTransformTestCase(TestCase):
+
+    def test_crop_flip_normalize(self):
+        import torch
+        from argparse import Namespace
+        from data.base_dataset import get_batch_transform
+
+        opt = Namespace(preprocess='crop', load_size=8, crop_size=4, no_flip=False)
+        images = torch.arange(2 * 3 * 8 * 8).view(2, 3, 8, 8).remainder(256).to(torch.uint8)
+        out = get_batch_transform(opt)(images)
+        self.assertEqual(out.shape, (2, 3, 4, 4))
+        self.assertTrue(out.min() >= -1 and out.max() <= 1)
+        # every output image is a (possibly flipped) window of its input
+        for image, crop in zip(images.float() / 127.5 - 1, out):
+            windows = image.unfold(1, 4, 1).unfold(2, 4, 1).permute(1, 2, 0, 3, 4).reshape(-1, 3, 4, 4)
+            self.assertTrue(any(torch.allclose(crop, w) or torch.allclose(crop, w.flip(2)) for w in windows))
+
+    def test_scale_width_none_and_tall_crop(self):
+        import torch
+        from argparse import Namespace
+        from data.base_dataset import get_batch_transform
+
+        images = torch.zeros([2, 3, 10, 6], dtype=torch.uint8)
+        opt = Namespace(preprocess='scale_width', load_size=12, crop_size=4, no_flip=True)
+        self.assertEqual(get_batch_transform(opt)(images).shape, (2, 3, 20, 12))
+        opt = Namespace(preprocess='none', load_size=12, crop_size=4, no_flip=True)
+        self.assertEqual(get_batch_transform(opt)(images).shape, (2, 3, 8, 8))  # rounded to multiples of 4
+        # only the height is larger than the crop
+        opt = Namespace(preprocess='crop', load_size=6, crop_size=6, no_flip=True)
+        self.assertEqual(get_batch_transform(opt)(images).shape, (2, 3, 6, 6))
+        opt = Namespace(preprocess='crop', load_size=8, crop_size=8, no_flip=True)
+        with self.assertRaises(ValueError):
+            get_batch_transform(opt)(images)
+
+
+class ContiguousBatchSamplerTestCase(TestCase):
+
+    def test_contiguous_batches(self):
+        from data.hdf5_dataset import ContiguousBatchSampler
+
+        sampler = ContiguousBatchSampler(1000, batch_size=30, chunk_rows=8)
+        batches = list(sampler)
+        self.assertEqual(len(batches), len(sampler))
+        for batch in batches:
+            self.assertEqual(len(batch), 30)
+            self.assertEqual([i % 1000 for i in range(batch[0], batch[0] + 30)], batch)
+        rows = [i for batch in batches for i in batch]
+        self.assertEqual(len(set(rows)), len(rows))
+
+    def test_epoch_covers_the_data_once(self):
+        from data.hdf5_dataset import ContiguousBatchSampler
+
+        sampler = ContiguousBatchSampler(1000, batch_size=30, chunk_rows=8, drop_last=False)
+        for _ in range(3):
+            self.assertEqual(sorted(i for batch in sampler for i in batch), list(range(1000)))
+
+    def test_skipped_rows_change_between_epochs(self):
+        from data.hdf5_dataset import ContiguousBatchSampler
+
+        sampler = ContiguousBatchSampler(1000, batch_size=30, chunk_rows=8, infinite=True)
+        stream = iter(sampler)
+        seen = set()
+        for _ in range(10 * len(sampler)):
+            seen.update(next(stream))
+        self.assertEqual(seen, set(range(1000)))
+
+
+class ImageIndexTestCase(TestCase):
+
+    def test_index_is_reused_until_the_folder_changes(self):
+        import os
+        import tempfile
+        from data.image_folder import make_dataset
+
+        with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as cache_dir:
+            os.makedirs(os.path.join(root, 'a'))
+            for name in ['a/1.png', '2.jpg', 'notes.txt']:
+                open(os.path.join(root, name), 'w').close()
+            index_filename = os.path.join(cache_dir, 'image_index.npz')
+            images = sorted(make_dataset(root, index_filename=index_filename))
+            self.assertEqual(images, sorted([os.path.join(root, 'a', '1.png'), os.path.join(root, '2.jpg')]))
+            self.assertEqual(sorted(make_dataset(root, index_filename=index_filename)), images)
+            open(os.path.join(root, '3.png'), 'w').close()
+            self.assertEqual(len(make_dataset(root, index_filename=index_filename)), 3)
+            open(os.path.join(root, 'a', '4.png'), 'w').close()  # only the mtime of the subdirectory changes
+            self.assertEqual(len(make_dataset(root, index_filename=index_filename)), 4)
+            with self.assertRaises(ValueError):
+                make_dataset(root, index_filename=os.path.join(root, 'image_index.npz'))
+
+
+class PackLabelsTestCase(TestCase):
+
+    def test_labels_of_the_folder_layouts(self):
+        import os
+        from data.pack_image_folder import get_labels
+
+        root = os.path.join('datasets', 'folder')
+        flat = [os.path.join(root, name) for name in ['1.png', '2.png']]
+        self.assertEqual(get_labels(root, flat).tolist(), [0, 0])
+        classes = [os.path.join(root, 'cat', '1.png'), os.path.join(root, 'dog', '2.png')]
+        self.assertEqual(get_labels(root, classes).tolist(), [0, 1])
+        with self.assertRaises(ValueError):
+            get_labels(root, flat + classes)
@@ -20,6 +20,7 @@ from __future__ import absolute_import, division, print_function
 import numpy as np
 import os
 import gzip, pickle
+from concurrent.futures import ThreadPoolExecutor
 import tensorflow.compat.v1 as tf
 tf.disable_v2_behavior()
 from scipy.misc import imread
@@ -89,7 +90,7 @@ def get_activations(images, sess, batch_size=50, verbose=False):
         batch_size = d0
     n_batches = d0//batch_size
     n_used_imgs = n_batches*batch_size
-    pred_arr = np.empty((n_used_imgs,2048))
+    pred_arr = np.empty((n_used_imgs,2048), dtype=np.float32)
     for i in range(n_batches):
         if verbose:
             print("\rPropagating batch %d/%d" % (i+1, n_batches))
@@ -101,6 +102,61 @@ def get_activations(images, sess, batch_size=50, verbose=False):
     if verbose:
         print(" done")
     return pred_arr
+
+
+def _load_batch(files):
+    batch = None
+    for i, fn in enumerate(files):
+        img = imread(str(fn))
+        if batch is None:
+            batch = np.empty((len(files),) + img.shape, dtype=np.float32)
+        batch[i] = img
+    return batch
+
+
+def get_activations_from_files(files, sess, batch_size=50, num_workers=8, prefetch=4, verbose=False):
+    """Calculates the activations of the pool_3 layer for all images in files.
+
+    Unlike get_activations, the images are never all in memory: a pool of
+    num_workers threads decodes them in batches, at most prefetch batches ahead
+    of the batch being fed to the network.
+
+    Params:
+    -- files       : List of paths to image files of identical size.
+    -- sess        : current session
+    -- batch_size  : number of images fed to the network at once
+    -- num_workers : number of decoding threads
+    -- prefetch    : number of batches decoded ahead
+    -- verbose     : If set to True, the number of calculated batches is reported.
+    Returns:
+    -- A float32 numpy array of dimension (num images, 2048) that contains the
+       activations of the given tensor when feeding inception with the query tensor.
+    """
+    inception_layer = _get_inception_layer(sess)
+    d0 = len(files)
+    if batch_size > d0:
+        print("warning: batch size is bigger than the data size. setting batch size to data size")
+        batch_size = d0
+    n_batches = d0//batch_size
+    n_used_imgs = n_batches*batch_size
+    pred_arr = np.empty((n_used_imgs,2048), dtype=np.float32)
+    with ThreadPoolExecutor(num_workers) as executor:
+        pending = [executor.submit(_load_batch, files[i*batch_size:(i+1)*batch_size])
+                   for i in range(min(prefetch, n_batches))]
+        for i in range(n_batches):
+            if verbose:
+                print("\rPropagating batch %d/%d" % (i+1, n_batches))
+            batch = pending.pop(0).result()
+            if i + prefetch < n_batches:
+                j = i + prefetch
+                pending.append(executor.submit(_load_batch, files[j*batch_size:(j+1)*batch_size]))
+            start = i*batch_size
+            end = start + batch_size
+            pred = sess.run(inception_layer, {'FID_Inception_Net/ExpandDims:0': batch})
+            pred_arr[start:end] = pred.reshape(batch_size,-1)
+    if verbose:
+        print(" done")
+    return pred_arr
 #-------------------------------------------------------------------------------
 
 
@@ -206,7 +262,7 @@ def check_or_download_inception(inception_path):
     return str(model_file)
 
 
-def _handle_path(path, sess):
+def _handle_path(path, sess, cache=None, batch_size=50, num_workers=8):
     if path.endswith('.npz'):
         f = np.load(path)
         m, s = f['mu'][:], f['sigma'][:]
@@ -214,13 +270,28 @@ def _handle_path(path, sess):
     else:
         path = pathlib.Path(path)
         files = list(path.glob('*.jpg')) + list(path.glob('*.png'))
-        x = np.array([imread(str(fn)).astype(np.float32) for fn in files])
-        m, s = calculate_activation_statistics(x, sess)
+        if cache is not None:
+            from util.stats_cache import hash_files
+            key = 'tf_pool3_' + hash_files(files)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry['mu'], entry['sigma']
+        act = get_activations_from_files(files, sess, batch_size, num_workers)
+        m, s = np.mean(act, axis=0), np.cov(act, rowvar=False)
+        if cache is not None:
+            cache.put(key, mu=m, sigma=s)
     return m, s
 
 
-def calculate_fid_given_paths(paths, inception_path):
-    ''' Calculates the FID of two paths. '''
+def calculate_fid_given_paths(paths, inception_path, cache_dir=None, cache_size_mb=2048, batch_size=50,
+                              num_workers=8):
+    ''' Calculates the FID of two paths.
+        With cache_dir, the statistics of image folders are cached on disk,
+        keyed by a hash of the image files. '''
+    cache = None
+    if cache_dir:
+        from util.stats_cache import StatsCache
+        cache = StatsCache(cache_dir, cache_size_mb)
     inception_path = check_or_download_inception(inception_path)
 
     for p in paths:
@@ -230,8 +301,8 @@ def calculate_fid_given_paths(paths, inception_path):
     create_inception_graph(str(inception_path))
     with tf.Session() as sess:
         sess.run(tf.global_variables_initializer())
-        m1, s1 = _handle_path(paths[0], sess)
-        m2, s2 = _handle_path(paths[1], sess)
+        m1, s1 = _handle_path(paths[0], sess, cache, batch_size, num_workers)
+        m2, s2 = _handle_path(paths[1], sess, cache, batch_size, num_workers)
         fid_value = calculate_frechet_distance(m1, s1, m2, s2)
         return fid_value
 
@@ -245,7 +316,16 @@ if __name__ == "__main__":
         help='Path to Inception model (will be downloaded if not provided)')
     parser.add_argument("--gpu", default="", type=str,
         help='GPU to use (leave blank for CPU only)')
+    parser.add_argument("--cache_dir", default=None, type=str,
+        help='Directory caching the statistics of image folders (no cache if not provided)')
+    parser.add_argument("--cache_size", default=2048, type=int,
+        help='Size bound of the statistics cache in MB')
+    parser.add_argument("--batch_size", default=50, type=int,
+        help='Number of images fed to the Inception network at once')
+    parser.add_argument("--num_workers", default=8, type=int,
+        help='Number of image decoding threads')
     args = parser.parse_args()
     os.environ['CUDA_VISIBLE_DEVICES'] = args.gpu
-    fid_value = calculate_fid_given_paths(args.path, args.inception)
+    fid_value = calculate_fid_given_paths(args.path, args.inception, args.cache_dir, args.cache_size,
+                                          args.batch_size, args.num_workers)
     print("FID: ", fid_value)
@@ -0,0 +1,157 @@
+# coding=utf-8
+
+import torch
+
+
+def nearest_centroids(x: torch.Tensor, centroids: torch.Tensor, batch_size=8192) -> torch.Tensor:
+    """
+    assign every row of x to its closest centroid in l2 distance
+    """
+    half_norms = centroids.pow(2).sum(1) / 2
+    assignments = []
+    for i in range(0, x.shape[0], batch_size):
+        scores = x[i:i + batch_size].mm(centroids.transpose(0, 1)) - half_norms
+        assignments.append(scores.argmax(1))
+    return torch.cat(assignments)
+
+
+def kmeans(x: torch.Tensor, n_clusters: int, n_iter=10, max_train_size=None, seed=0, init=None):
+    """
+    Lloyd's k-means, trained on at most `max_train_size` random rows of x,
+    starting from the centroids `init` if given, else from random rows
+    return the centroids and the assignment of every row of x
+    """
+    generator = torch.Generator().manual_seed(seed)
+    perm = torch.randperm(x.shape[0], generator=generator).to(x.device)
+    train = x[perm[:max_train_size]]
+    if init is not None:
+        centroids = init.clone()
+        n_clusters = centroids.shape[0]
+    else:
+        n_clusters = min(n_clusters, train.shape[0])
+        centroids = train[:n_clusters].clone()
+    for _ in range(n_iter):
+        assignment = nearest_centroids(train, centroids)
+        sums = torch.zeros_like(centroids).index_add_(0, assignment, train)
+        counts = torch.bincount(assignment, minlength=n_clusters)
+        non_empty = counts > 0
+        centroids[non_empty] = sums[non_empty] / counts[non_empty].unsqueeze(1).to(sums.dtype)
+    return centroids, nearest_centroids(x, centroids)
+
+
+class IVFIndex:
+    """
+    Inverted file index for maximum inner product search,
+    with a k-means coarse quantizer and optional product quantization of the residuals.
+
+    Built once over a fixed set of (normalized) vectors, e.g. the target embedding;
+    an index over vectors that drift can be rebuilt cheaply from the previous `centroids` (`init_centroids`).
+    Queries probe the `n_probe` closest lists only; with `pq_m > 0` list members
+    are scored from their codes, and the best `rerank` candidates are re-scored exactly.
+    """
+
+    def __init__(self, vecs: torch.Tensor, n_lists=1024, n_probe=16, pq_m=0, pq_bits=8, rerank=0,
+                 n_iter=10, seed=0, init_centroids=None):
+        self.vecs = vecs
+        self.n_probe = n_probe
+        self.pq_m = pq_m
+        self.rerank = rerank
+
+        self.centroids, assignment = kmeans(vecs, n_lists, n_iter, max_train_size=256 * n_lists, seed=seed,
+                                            init=init_centroids)
+        self.n_lists = self.centroids.shape[0]
+        self.order = torch.argsort(assignment)
+        counts = torch.bincount(assignment, minlength=self.n_lists)
+        self.offsets = [0] + torch.cumsum(counts, 0).tolist()
+
+        if pq_m > 0:
+            dim = vecs.shape[1]
+            if dim % pq_m != 0:
+                raise ValueError(f'embedding dim {dim} is not divisible by pq_m {pq_m}')
+            residuals = (vecs - self.centroids[assignment])[self.order]
+            residuals = residuals.view(residuals.shape[0], pq_m, dim // pq_m)
+            codebooks, codes = [], []
+            for m in range(pq_m):
+                codebook, code = kmeans(
+                    residuals[:, m].contiguous(), 2 ** pq_bits, n_iter, max_train_size=256 * 2 ** pq_bits, seed=seed,
+                )
+                codebooks.append(codebook)
+                codes.append(code)
+            self.codebooks = torch.stack(codebooks)  # shape: (M, K, D / M)
+            self.codes = torch.stack(codes, 1)  # shape: (N, M), in list order
+        else:
+            self.sorted_vecs = vecs[self.order]
+
+    def _score_list(self, query: torch.Tensor, list_idx: int, lut=None) -> torch.Tensor:
+        start, end = self.offsets[list_idx], self.offsets[list_idx + 1]
+        if self.pq_m > 0:
+            # asymmetric distance: <q, c> + sum_m <q_m, codebook_m[code_m]>
+            codes = self.codes[start:end]
+            residual_scores = lut[:, torch.arange(self.pq_m, device=codes.device).unsqueeze(0), codes].sum(-1)
+            return query.mv(self.centroids[list_idx]).unsqueeze(1) + residual_scores
+        return query.mm(self.sorted_vecs[start:end].transpose(0, 1))
+
+    def approximate_search(self, query: torch.Tensor, k: int):
+        """
+        return the approximate top-k inner products and indices of every query
+        missing neighbors (too few probed candidates) are filled with -inf / -1
+        """
+        nq = query.shape[0]
+        best_scores = query.new_full((nq, k), -float('inf'))
+        best_idx = torch.full((nq, k), -1, dtype=torch.long, device=query.device)
+
+        probes = query.mm(self.centroids.transpose(0, 1)).topk(min(self.n_probe, self.n_lists), dim=1)[1]
+        # group (query, list) pairs by list so that each list is scanned once
+        flat_probes = probes.flatten()
+        pair_order = torch.argsort(flat_probes)
+        pair_queries = torch.arange(nq, device=query.device).repeat_interleave(probes.shape[1])[pair_order]
+        pair_offsets = [0] + torch.cumsum(torch.bincount(flat_probes, minlength=self.n_lists), 0).tolist()
+
+        lut = None
+        if self.pq_m > 0:
+            sub_query = query.view(nq, self.pq_m, -1)
+            lut = torch.einsum('qmd,mkd->qmk', [sub_query, self.codebooks])  # shape: (Q, M, K)
+
+        for list_idx in range(self.n_lists):
+            start, end = self.offsets[list_idx], self.offsets[list_idx + 1]
+            if start == end or pair_offsets[list_idx] == pair_offsets[list_idx + 1]:
+                continue
+            qi = pair_queries[pair_offsets[list_idx]:pair_offsets[list_idx + 1]]
+            scores = self._score_list(query[qi], list_idx, lut[qi] if lut is not None else None)
+            candidate_scores, candidate_idx = scores.topk(min(k, end - start), dim=1)
+            candidate_idx = self.order[start:end][candidate_idx]
+            merged_scores, merged = torch.cat([best_scores[qi], candidate_scores], 1).topk(k, dim=1)
+            best_idx[qi] = torch.cat([best_idx[qi], candidate_idx], 1).gather(1, merged)
+            best_scores[qi] = merged_scores
+        return best_scores, best_idx
+
+    def search(self, query: torch.Tensor, k: int):
+        """
+        return the top-k inner products and indices of every query,
+        re-ranking a shortlist of `rerank` candidates exactly if product quantization is on
+        """
+        if self.pq_m == 0 or self.rerank == 0:
+            return self.approximate_search(query, k)
+        _, shortlist = self.approximate_search(query, max(k, self.rerank))
+        scores = torch.einsum('qd,qsd->qs', [query, self.vecs[shortlist.clamp(min=0)]])
+        scores[shortlist < 0] = -float('inf')
+        top_k_scores, top_k = scores.topk(k, dim=1)
+        return top_k_scores, shortlist.gather(1, top_k)
+
+    def exact_search(self, query: torch.Tensor, k: int, batch_size=1024):
+        scores, idx = [], []
+        vecs = self.vecs.transpose(0, 1)
+        for i in range(0, query.shape[0], batch_size):
+            batch_scores, batch_idx = query[i:i + batch_size].mm(vecs).topk(k, dim=1)
+            scores.append(batch_scores)
+            idx.append(batch_idx)
+        return torch.cat(scores), torch.cat(idx)
+
+    def recall(self, query: torch.Tensor, k: int) -> float:
+        """
+        fraction of the exact top-k neighbors retrieved by search, averaged over the queries
+        """
+        _, approximate = self.search(query, k)
+        _, exact = self.exact_search(query, k)
+        hits = (approximate.unsqueeze(2) == exact.unsqueeze(1)).any(-1).float().sum(-1) / k
+        return hits.mean().item()
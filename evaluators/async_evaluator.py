@@ -0,0 +1,110 @@
+import copy
+import queue
+import threading
+
+import torch
+
+from . import get_evaluator
+
+
+class AsyncEvaluator:
+    """
+    Evaluate snapshots of netG in a background thread, so that training does not wait for the scores.
+
+    submit() takes a cheap on-device copy of netG's weights and of the last inputs / outputs,
+    the worker loads it into a private replica of the model and runs a regular evaluator on it,
+    so the training model is never touched by evaluation.
+    At most `eval_queue_size` snapshots are pending, the oldest ones are dropped when evaluation falls behind.
+    """
+
+    def __init__(self, opt, model, dataset):
+        self.opt = opt
+        self.model = model
+        self.device = torch.device(opt.eval_device) if opt.eval_device else model.get_device()
+
+        self.source_net = model.netG
+        if isinstance(self.source_net, torch.nn.DataParallel) and self.device != model.get_device():
+            self.source_net = self.source_net.module
+
+        # shallow copy: shares everything but the generator, inputs and outputs
+        self.snapshot_model = copy.copy(model)
+        self.snapshot_model.netG = copy.deepcopy(self.source_net).to(self.device)
+        self.snapshot_model.device = self.device
+        self.snapshot_model.inputs = {}
+        self.snapshot_model.set_output(None)
+        self.evaluator = get_evaluator(opt, model=self.snapshot_model, dataset=dataset)
+
+        self.snapshots = queue.Queue(maxsize=opt.eval_queue_size)
+        self.results = queue.Queue()
+        self.num_dropped = 0
+        self.error = None
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, iteration: int):
+        """
+        snapshot the current generator for evaluation, never blocks
+        """
+        output = self.model.get_output()
+        snapshot = {
+            'iteration': iteration,
+            'netG': {key: value.detach().clone() for key, value in self.source_net.state_dict().items()},
+            'inputs': {key: value.detach().clone() for key, value in getattr(self.model, 'inputs', {}).items()},
+            'output': output.detach().clone() if output is not None else None,
+        }
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:  # coalesce: the newest snapshot replaces the oldest pending one
+                    self.snapshots.get_nowait()
+                    self.num_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def poll(self) -> list:
+        """
+        return the (iteration, scores) of the snapshots evaluated so far
+        """
+        if self.error is not None:
+            raise self.error
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def close(self) -> list:
+        """
+        wait for the pending snapshots and return their results, raise the error of the worker if it failed
+        """
+        # a dead worker never frees the queue, so the stop signal is only queued while it runs
+        while self.worker.is_alive():
+            try:
+                self.snapshots.put(None, timeout=1.)
+                break
+            except queue.Full:
+                pass
+        self.worker.join()
+        return self.poll()
+
+    def _run(self):
+        while True:
+            snapshot = self.snapshots.get()
+            if snapshot is None:
+                return
+            try:
+                self.snapshot_model.netG.load_state_dict(snapshot['netG'])
+                self.snapshot_model.inputs = {
+                    key: value.to(self.device) for key, value in snapshot['inputs'].items()
+                }
+                if snapshot['output'] is not None:
+                    self.snapshot_model.set_output(snapshot['output'].to(self.device))
+                with torch.no_grad():
+                    scores = self.evaluator.get_current_scores()
+            except Exception as e:
+                self.error = e
+                return
+            self.results.put((snapshot['iteration'], {**scores, 'dropped_snapshots': self.num_dropped}))
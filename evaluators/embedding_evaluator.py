@@ -2,11 +2,13 @@
 
 from functools import partial
 import os
+import time
 from typing import List, Dict
 
 import torch
 import numpy as np
 
+from .ann_index import IVFIndex
 from .base_evaluator import BaseEvaluator
 
 MUSE_EVALUATION_DATA_PATH = './crosslingual/dictionaries/'
@@ -29,9 +31,34 @@ class EmbeddingEvaluator(BaseEvaluator):
         }
         self.score_name = opt.score_name[0]  # support only one score for now
         self.muse_source = None
+        self.use_ann = opt.ann_n_lists > 0
+        if self.use_ann and opt.eval_compare_exact:
+            raise ValueError('--eval_compare_exact compares the --eval_precision sweep, which --ann_n_lists replaces')
+        self.ann_index = None  # built once, the target side never changes
+        self.source_centroids = None  # coarse quantizer of the last index over the mapped source
+        self.precision = opt.eval_precision
 
     def get_current_scores(self):
-        return self.score_fns[self.score_name]()
+        score_fn = self.score_fns[self.score_name]
+        if self.precision == 'fp32' or not self.opt.eval_compare_exact:
+            return score_fn()
+
+        # run the low precision and the exact path, report how far and how fast the former is
+        start_time = time.time()
+        scores = score_fn()
+        fast_time = time.time() - start_time
+        self.precision = 'fp32'
+        try:
+            start_time = time.time()
+            exact_scores = score_fn()
+            exact_time = time.time() - start_time
+        finally:
+            self.precision = self.opt.eval_precision
+        deviations = {
+            f'{key}_deviation': scores[key] - exact_scores[key]
+            for key in scores if key.startswith('P@')
+        }
+        return {**scores, **deviations, 'speedup': exact_time / fast_time}
 
     def _get_previously_predicted_scores(self):
         """
@@ -45,10 +72,28 @@ class EmbeddingEvaluator(BaseEvaluator):
             source_words, predicted_embedding,
         )
 
-        target_embedding = self.dataset.target_vecs  # shape: (V, E)
-        target_embedding = torch.from_numpy(target_embedding)
-        distance = self.cosine_distance(predicted_embedding, target_embedding)  # shape: (N, V)
-        top_k_distance, top_k_idx = torch.topk(distance, k=self.k, largest=False, dim=-1)
+        ann_scores = {}
+        if self.use_ann:
+            index = self._get_ann_index()
+            query = predicted_embedding.to(self.device)
+            query = query / query.norm(2, dim=-1, keepdim=True)
+            top_k_similarity, top_k_idx = index.search(query, self.k)
+            top_k_distance, top_k_idx = 1 - top_k_similarity.cpu(), top_k_idx.cpu()
+            if self.opt.ann_report_recall:
+                ann_scores[f'ann_recall@{self.k}'] = index.recall(query, self.k)
+        elif self.precision != 'fp32':
+            # coarse low precision sweep, then exact re-scoring of the shortlist
+            target_embedding = torch.from_numpy(self.dataset.target_vecs)
+            target_embedding = target_embedding / target_embedding.norm(2, dim=-1, keepdim=True)
+            query = predicted_embedding / predicted_embedding.norm(2, dim=-1, keepdim=True)
+            candidates = self.low_precision_shortlist(query, target_embedding, self.opt.eval_shortlist, self.precision)
+            top_k_similarity, top_k = self.rescore(query, target_embedding, candidates).topk(self.k, dim=-1)
+            top_k_distance, top_k_idx = 1 - top_k_similarity, candidates.gather(1, top_k)
+        else:
+            target_embedding = self.dataset.target_vecs  # shape: (V, E)
+            target_embedding = torch.from_numpy(target_embedding)
+            distance = self.cosine_distance(predicted_embedding, target_embedding)  # shape: (N, V)
+            top_k_distance, top_k_idx = torch.topk(distance, k=self.k, largest=False, dim=-1)
         # top_k_idx.shape: (N, k)
 
         precisions = {
@@ -64,6 +109,7 @@ class EmbeddingEvaluator(BaseEvaluator):
             'mean_distance': mean_distance,
             'mean_min_distance': mean_min_distance,
             'mean_max_distance': mean_max_distance,
+            **ann_scores,
         }
 
     def _filter_mismatched_vocab(self, source_words: List[str], predicted_embedding: torch.Tensor):
@@ -124,18 +170,60 @@ class EmbeddingEvaluator(BaseEvaluator):
         emb1 = emb1 / emb1.norm(2, 1, keepdim=True).expand_as(emb1)
         emb2 = emb2 / emb2.norm(2, 1, keepdim=True).expand_as(emb2)
 
-        # get average k-nearest-neighbors distance between all embedding pairs
-        average_dist1 = self.get_nn_avg_dist(emb2, emb1, self.k, self.opt.batch_size)
-        average_dist2 = self.get_nn_avg_dist(emb1, emb2, self.k, self.opt.batch_size)
-
-        # queries -> scores
+        # only the dictionary words are queried, the rest of emb1 is needed for r_S only
         query = emb1[self.muse_source['idx']]
-        scores = query.mm(emb2.transpose(0, 1))
-        scores.mul_(2)
-        scores.sub_(average_dist1[self.muse_source['idx']][:, np.newaxis])
-        scores.sub_(average_dist2[np.newaxis, :])
 
-        top_k_similarity, top_k_idx = torch.topk(scores, k=self.k, largest=True, dim=-1)
+        ann_scores = {}
+        if self.use_ann:
+            # r_T from the target index, r_S from an index over the mapped source vocabulary.
+            # The latter cannot be cached as netG changes emb1 between evaluations,
+            # but its k-means is warm-started from the previous centroids, as the mapping drifts slowly.
+            index = self._get_ann_index()
+            average_dist1 = index.search(query, self.k)[0].mean(1)
+            source_index = self._build_ann_index(emb1, init_centroids=self.source_centroids)
+            self.source_centroids = source_index.centroids
+            average_dist2 = source_index.search(emb2, self.k)[0].mean(1)
+
+            # queries -> scores, on the shortlist retrieved by the target index only,
+            # wider than k as the CSLS penalty re-orders the nearest neighbors
+            similarity, candidates = index.search(query, max(self.k, self.opt.ann_csls_shortlist))
+            scores = 2 * similarity - average_dist1[:, np.newaxis] - average_dist2[candidates.clamp(min=0)]
+            scores[candidates < 0] = -float('inf')  # too few probed candidates
+            top_k_similarity, top_k = torch.topk(scores, k=self.k, largest=True, dim=-1)
+            top_k_idx = candidates.gather(1, top_k)
+            if self.opt.ann_report_recall:
+                ann_scores[f'ann_recall@{self.k}'] = index.recall(query, self.k)
+        else:
+            # get average k-nearest-neighbors distance in both directions with one sweep over emb1 @ emb2^T
+            # r_S needs the whole mapped source vocabulary, so r_T of the queries comes for free
+            average_dist1, average_dist2 = self.get_bidirectional_nn_avg_dist(
+                emb1,
+                emb2,
+                self.k,
+                tile_size=self.opt.knn_tile_size,
+                max_memory=self.opt.knn_max_memory * 2 ** 20,
+                # the thread count is process-wide, so an evaluation running beside training must not change it
+                num_threads=0 if getattr(self.opt, 'async_eval', False) else self.opt.eval_num_threads,
+                precision=self.precision,
+                shortlist=self.opt.eval_knn_shortlist,
+            )
+            average_dist1 = average_dist1[self.muse_source['idx']]
+
+            if self.precision == 'fp32':
+                # queries -> scores
+                scores = query.mm(emb2.transpose(0, 1))
+                scores.mul_(2)
+                scores.sub_(average_dist1[:, np.newaxis])
+                scores.sub_(average_dist2[np.newaxis, :])
+
+                top_k_similarity, top_k_idx = torch.topk(scores, k=self.k, largest=True, dim=-1)
+            else:
+                # queries -> scores, re-scored exactly on the low precision shortlist only
+                candidates = self.low_precision_shortlist(query, emb2, self.opt.eval_shortlist, self.precision)
+                scores = 2 * self.rescore(query, emb2, candidates)
+                scores = scores - average_dist1[:, np.newaxis] - average_dist2[candidates]
+                top_k_similarity, top_k = torch.topk(scores, k=self.k, largest=True, dim=-1)
+                top_k_idx = candidates.gather(1, top_k)
 
         precisions = {
             f'P@{k}': (top_k_idx[:, :k] == target_idx).float().sum(-1).mean().item()
@@ -150,8 +238,28 @@ class EmbeddingEvaluator(BaseEvaluator):
             'mean_similarity': mean_similarity,
             'mean_min_similarity': mean_min_similarity,
             'mean_max_similarity': mean_max_similarity,
+            **ann_scores,
         }
 
+    def _build_ann_index(self, vecs: torch.Tensor, init_centroids=None) -> IVFIndex:
+        return IVFIndex(
+            vecs,
+            n_lists=self.opt.ann_n_lists,
+            n_probe=self.opt.ann_n_probe,
+            pq_m=self.opt.ann_pq_m,
+            rerank=self.opt.ann_rerank,
+            # a warm start only needs to follow the drift of the vectors
+            n_iter=10 if init_centroids is None else 2,
+            init_centroids=init_centroids,
+        )
+
+    def _get_ann_index(self) -> IVFIndex:
+        if self.ann_index is None:
+            target_vecs = torch.from_numpy(self.dataset.target_vecs).to(self.device)
+            target_vecs = target_vecs / target_vecs.norm(2, dim=-1, keepdim=True)
+            self.ann_index = self._build_ann_index(target_vecs)
+        return self.ann_index
+
     def _load_muse_dictionary(self, language):
         dictionary_path = os.path.join(
             MUSE_EVALUATION_DATA_PATH,
@@ -216,3 +324,115 @@ class EmbeddingEvaluator(BaseEvaluator):
             all_distances.append(best_distances.mean(1))
         all_distances = torch.cat(all_distances)
         return all_distances
+
+    @staticmethod
+    def get_bidirectional_nn_avg_dist(emb1, emb2, knn, tile_size=4096, max_memory=0, num_threads=0,
+                                      precision='fp32', shortlist=0):
+        """
+        Compute the average distance of the `knn` nearest neighbors
+        of emb1 in emb2 and of emb2 in emb1 with a single sweep.
+        Every block of emb1 @ emb2^T is computed once and folded into
+        running row-wise and column-wise top-k accumulators.
+        `max_memory` (bytes) shrinks the tile so that one block fits in it,
+        `num_threads` sets the threads of the CPU matmul during the sweep, 0 keeps the current ones;
+        torch's thread count is process-wide, so callers running beside training must pass 0.
+        With `precision` bf16 the best max(knn, shortlist) neighbors
+        of the sweep are re-scored exactly in fp32.
+        """
+        if max_memory > 0:
+            max_tile_size = int((max_memory / emb1.element_size()) ** 0.5)
+            tile_size = max(1, min(tile_size, max_tile_size))
+        n1, n2 = emb1.shape[0], emb2.shape[0]
+        knn1, knn2 = min(knn, n2), min(knn, n1)
+        keep = knn if precision == 'fp32' else max(knn, shortlist)
+        keep1, keep2 = min(keep, n2), min(keep, n1)
+        row_best = emb1.new_full((n1, keep1), -float('inf'))
+        col_best = emb1.new_full((keep2, n2), -float('inf'))
+        rescoring = precision != 'fp32'  # only the re-scored shortlists need the neighbor indices
+        if rescoring:
+            row_idx = torch.zeros((n1, keep1), dtype=torch.int32, device=emb1.device)  # half the memory of int64
+            col_idx = torch.zeros((keep2, n2), dtype=torch.int32, device=emb1.device)
+        low1 = EmbeddingEvaluator.quantize(emb1, precision)
+        low2 = EmbeddingEvaluator.quantize(emb2, precision)
+
+        default_num_threads = torch.get_num_threads()
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        try:
+            for i in range(0, n1, tile_size):
+                rows = low1[i:i + tile_size]
+                for j in range(0, n2, tile_size):
+                    block = EmbeddingEvaluator.low_precision_mm(rows, low2[j:j + tile_size])
+
+                    candidates, candidates_idx = block.topk(min(keep1, block.shape[1]), dim=1)
+                    row_best[i:i + tile_size], merged = torch.cat(
+                        [row_best[i:i + tile_size], candidates], dim=1,
+                    ).topk(keep1, dim=1)
+                    if rescoring:
+                        row_idx[i:i + tile_size] = torch.cat(
+                            [row_idx[i:i + tile_size], (candidates_idx + j).int()], dim=1,
+                        ).gather(1, merged)
+
+                    candidates, candidates_idx = block.topk(min(keep2, block.shape[0]), dim=0)
+                    col_best[:, j:j + tile_size], merged = torch.cat(
+                        [col_best[:, j:j + tile_size], candidates], dim=0,
+                    ).topk(keep2, dim=0)
+                    if rescoring:
+                        col_idx[:, j:j + tile_size] = torch.cat(
+                            [col_idx[:, j:j + tile_size], (candidates_idx + i).int()], dim=0,
+                        ).gather(0, merged)
+        finally:
+            torch.set_num_threads(default_num_threads)
+
+        if not rescoring:
+            return row_best.mean(1), col_best.mean(0)
+        del row_best, col_best, low1, low2
+        row_exact = EmbeddingEvaluator.rescore(emb1, emb2, row_idx).topk(knn1, dim=1)[0].mean(1)
+        del row_idx
+        col_exact = EmbeddingEvaluator.rescore(emb2, emb1, col_idx.transpose(0, 1)).topk(knn2, dim=1)[0].mean(1)
+        return row_exact, col_exact
+
+    @staticmethod
+    def quantize(x: torch.Tensor, precision: str) -> torch.Tensor:
+        """
+        Return a low precision copy of x
+        """
+        if precision == 'fp32':
+            return x
+        elif precision == 'bf16':
+            return x.to(torch.bfloat16)
+        else:
+            raise ValueError(f'unsupported precision {precision}')
+
+    @staticmethod
+    def low_precision_mm(a, b) -> torch.Tensor:
+        """
+        a @ b^T of quantized rows in fp32
+        """
+        return a.mm(b.transpose(0, 1)).float()
+
+    @staticmethod
+    def low_precision_shortlist(query, emb, shortlist, precision, batch_size=1024) -> torch.Tensor:
+        """
+        indices of the `shortlist` best rows of emb for every query, swept in low precision
+        """
+        low_query = EmbeddingEvaluator.quantize(query, precision)
+        low_emb = EmbeddingEvaluator.quantize(emb, precision)  # converted once for all the query batches
+        candidates = []
+        for i in range(0, query.shape[0], batch_size):
+            scores = EmbeddingEvaluator.low_precision_mm(low_query[i:i + batch_size], low_emb)
+            candidates.append(scores.topk(min(shortlist, emb.shape[0]), dim=1)[1])
+        return torch.cat(candidates)
+
+    @staticmethod
+    def rescore(query, emb, candidates, max_memory=2 ** 28) -> torch.Tensor:
+        """
+        exact inner products between every query and its candidate rows of emb,
+        the queries are batched so that the gathered candidate rows fit in `max_memory` bytes
+        """
+        batch_size = max(1, max_memory // (candidates.shape[1] * emb.shape[1] * emb.element_size()))
+        scores = []
+        for i in range(0, query.shape[0], batch_size):
+            rows = emb[candidates[i:i + batch_size].long()]
+            scores.append(torch.einsum('nd,nkd->nk', [query[i:i + batch_size], rows]))
+        return torch.cat(scores)
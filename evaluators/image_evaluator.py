@@ -1,8 +1,11 @@
 from collections import OrderedDict
 
 import numpy as np
+import torch
 
 from evaluators.inception_pytorch import inception_utils
+from models.networks.utils import get_prior
+from util.stats_cache import StatsCache, hash_state_dict
 from .base_evaluator import BaseEvaluator
 
 
@@ -10,16 +13,28 @@ class ImageEvaluator(BaseEvaluator):
 
     def __init__(self, opt, model, dataset):
         super().__init__(opt, model, dataset)
+        self.generator = torch.Generator(self.device).manual_seed(opt.eval_seed)  # noise of sample()
         # scores init
         if self.opt.use_pytorch_scores and self.opt.score_name is not None:
             no_FID = not('FID' in self.opt.score_name)
             no_IS = not('IS' in self.opt.score_name)
+            no_KID = not('KID' in self.opt.score_name)
             parallel = len(opt.gpu_ids) > 1
             self.get_inception_metrics = inception_utils.prepare_inception_metrics(
                 opt.dataset_name,
                 parallel,
                 no_IS,
                 no_FID,
+                device=opt.inception_device or self.device,
+                channels_last=opt.inception_channels_last,
+                bf16=opt.inception_bf16,
+                # the thread count is process-wide, so an evaluation running beside training must not change it
+                num_threads=0 if opt.async_eval else opt.inception_num_threads,
+                no_kid=no_KID,
+                kid_size=opt.kid_size,
+                kid_subsets=opt.kid_subsets,
+                kid_real_images=self.real_images,
+                cache=StatsCache(opt.stats_cache_dir, opt.stats_cache_size) if opt.stats_cache_dir else None,
             )
         elif 'FID' in self.opt.score_name:
             from evaluators.TTUR import fid
@@ -41,21 +56,70 @@ class ImageEvaluator(BaseEvaluator):
             # self.sess = tf.Session(config = config)
             # self.sess.run(tf.global_variables_initializer())
 
+    def real_images(self):
+        """Draw <kid_size> random real images from the dataset, the KID reference"""
+        dataset = self.dataset.dataset
+        generator = torch.Generator().manual_seed(0)
+        indices = torch.randperm(len(dataset), generator=generator)[:self.opt.kid_size]
+        batch = [dataset[i] for i in indices.tolist()]
+        if hasattr(dataset, 'collate_fn'):  # e.g. uint8 datasets normalizing whole batches
+            return dataset.collate_fn(batch)['data']
+        return torch.stack([item['data'] for item in batch])
+
+    def sample(self):
+        """Generate a chunk of <fid_batch_size> evaluation samples from netG"""
+        with torch.no_grad():
+            z = get_prior(self.opt.fid_batch_size, self.opt.z_dim, self.opt.z_type, self.device, self.generator)
+            return self.model.netG({'data': z})
+
+    def get_cache_key(self, netG):
+        """Key the cached statistics of the seeded samples of netG, which are a function of its weights
+        (eval mode, noise of a --eval_seed generator on this device type, as in sweep.py)"""
+        return hash_state_dict(netG.state_dict(), self.opt.eval_seed, self.device.type,
+                               self.opt.fid_batch_size, self.opt.z_dim, self.opt.z_type)
+
     def get_current_scores(self):
         scores_ret = OrderedDict()
-        # TODO
-        samples = self.model.get_output()
         if self.opt.use_pytorch_scores:
-            IS_mean, IS_var, FID = self.get_inception_metrics(
-                samples,
-                self.opt.batch_size,
-                num_splits=10,
-            )
+            cache_key = None
+            if self.opt.gan_mode == 'unconditional-z':
+                # stream <evaluation_size> fresh samples through the inception net
+                samples, num_samples = self.sample, self.opt.evaluation_size
+                if self.opt.stats_cache_dir:
+                    cache_key = self.get_cache_key(self.model.netG)
+            else:
+                samples = self.model.get_output()
+                num_samples = len(samples)
+            # a private generator, so that evaluation neither draws from nor reseeds the training RNG
+            self.generator = torch.Generator(self.device).manual_seed(self.opt.eval_seed)
+            # sample in eval mode, so that the batch norm statistics of the trained netG are not updated
+            netG_training = self.model.netG.training
+            self.model.netG.eval()
+            try:
+                IS_mean, IS_var, FID = self.get_inception_metrics(
+                    samples,
+                    num_samples,
+                    num_splits=10,
+                    stages=self.opt.adaptive_eval_stages,
+                    tolerance=self.opt.adaptive_eval_tolerance,
+                    cache_key=cache_key,
+                )
+            finally:
+                self.model.netG.train(netG_training)
             if 'FID' in self.opt.score_name:
                 scores_ret['FID'] = float(FID)
             if 'IS' in self.opt.score_name:
                 scores_ret['IS_mean'] = float(IS_mean)
                 scores_ret['IS_var'] = float(IS_var)
+            if 'KID' in self.opt.score_name:
+                scores_ret['KID_mean'], scores_ret['KID_std'] = map(float, self.get_inception_metrics.KID)
+            scores_ret['inception_images_per_sec'] = float(self.get_inception_metrics.images_per_second)
+            scores_ret['num_samples'] = int(self.get_inception_metrics.num_samples)
+            if self.get_inception_metrics.FID_ci is not None:
+                if 'FID' in self.opt.score_name:
+                    scores_ret['FID_ci'] = float(self.get_inception_metrics.FID_ci)
+                if 'IS' in self.opt.score_name:
+                    scores_ret['IS_ci'] = float(self.get_inception_metrics.IS_ci)
         return scores_ret
         #
         # else:
@@ -0,0 +1,95 @@
+''' Benchmark FID
+ This script compares the eigendecomposition-cached FrechetDistance with the
+ scipy sqrtm (numpy) and newton-schulz (torch) implementations, reporting
+ the FID of each and the time per evaluation. The reference moments are
+ read from a *_inception_moments.npz file, or drawn at random; the
+ "generated" moments are computed from random perturbations of them. '''
+import time
+
+import numpy as np
+import torch
+
+import inception_utils
+from argparse import ArgumentParser
+
+
+def prepare_parser():
+    usage = 'Compare accuracy and speed of the FID implementations.'
+    parser = ArgumentParser(description=usage)
+    parser.add_argument(
+        '--moments', type=str, default='',
+        help='Reference *_inception_moments.npz, random moments if empty (default: %(default)s)')
+    parser.add_argument(
+        '--dim', type=int, default=2048,
+        help='Dimension of the random moments (default: %(default)s)')
+    parser.add_argument(
+        '--num_samples', type=int, default=10000,
+        help='Number of activations the generated moments are estimated from (default: %(default)s)')
+    parser.add_argument(
+        '--repeats', type=int, default=5,
+        help='Number of timed evaluations per implementation (default: %(default)s)')
+    parser.add_argument(
+        '--device', type=str, default='cuda',
+        help='Device of the torch implementations (default: %(default)s)')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Random seed to use.')
+    return parser
+
+
+def timed(fn, repeats, device):
+    values, times = [], []
+    for _ in range(repeats):
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start_time = time.time()
+        values.append(float(fn()))
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.time() - start_time)
+    return values[-1], np.median(times)
+
+
+def run(config):
+    rng = np.random.RandomState(config['seed'])
+    device = torch.device(config['device'])
+    if config['moments']:
+        moments = np.load(config['moments'])
+        data_mu, data_sigma = moments['mu'], moments['sigma']
+    else:
+        basis = rng.randn(config['dim'], config['dim']) / np.sqrt(config['dim'])
+        data_mu, data_sigma = rng.randn(config['dim']), basis.dot(basis.T)
+    # generated activations: reference gaussian with a shifted mean and a rescaled basis
+    dim = len(data_mu)
+    factor = np.linalg.cholesky(data_sigma + 1e-6 * np.eye(dim)) * (1 + 0.1 * rng.rand(dim))
+    pool = data_mu + 0.1 + rng.randn(config['num_samples'], dim).dot(factor.T)
+    mu, sigma = pool.mean(0), np.cov(pool, rowvar=False)
+
+    start_time = time.time()
+    frechet_distance = inception_utils.FrechetDistance(data_mu, data_sigma, device)
+    setup_time = time.time() - start_time
+    mu_torch, sigma_torch = [torch.tensor(item).float().to(device) for item in [mu, sigma]]
+    data_mu_torch, data_sigma_torch = [torch.tensor(item).float().to(device) for item in [data_mu, data_sigma]]
+    results = {
+        'numpy (sqrtm)': timed(lambda: inception_utils.numpy_calculate_frechet_distance(
+            mu, sigma, data_mu, data_sigma), config['repeats'], device),
+        'torch (newton-schulz)': timed(lambda: inception_utils.torch_calculate_frechet_distance(
+            mu_torch, sigma_torch, data_mu_torch, data_sigma_torch), config['repeats'], device),
+        'torch (cached eigh)': timed(lambda: frechet_distance(mu, sigma), config['repeats'], device),
+    }
+    reference = results['numpy (sqrtm)'][0]
+    print('Cached reference sqrt computed in %.3f s' % setup_time)
+    for name, (FID, seconds) in results.items():
+        print('%-24s FID %12.5f  |error| %.3e  %8.4f s / evaluation' % (name, FID, abs(FID - reference), seconds))
+
+
+def main():
+    # parse command line
+    parser = prepare_parser()
+    config = vars(parser.parse_args())
+    print(config)
+    run(config)
+
+
+if __name__ == '__main__':
+    main()
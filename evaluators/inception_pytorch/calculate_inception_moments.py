@@ -5,10 +5,18 @@
  
  Note that if you don't shuffle the data, the IS of true data will be under-
  estimated as it is label-ordered. By default, the data is not shuffled
- so as to reduce non-determinism. '''
+ so as to reduce non-determinism.
+
+ Activations are folded into running float64 moments batch by batch. With
+ --num_shards N, each of N runs (--shard 0..N-1) handles a contiguous slice
+ of the data and checkpoints its statistics, so a killed run resumes where
+ it stopped; --merge_shards then combines them into the moments file. '''
+import os
+
 import numpy as np
 import torch
 import torch.nn.functional as F
+from torch.utils.data import DataLoader, Subset
 
 import utils
 import inception_utils
@@ -44,42 +52,109 @@ def prepare_parser():
     parser.add_argument(
         '--seed', type=int, default=0,
         help='Random seed to use.')
+    parser.add_argument(
+        '--device', type=str, default='cuda',
+        help='Device of the inception net, cuda or cpu (default: %(default)s)')
+    parser.add_argument(
+        '--num_shards', type=int, default=1,
+        help='Split the dataset into this many contiguous shards (default: %(default)s)')
+    parser.add_argument(
+        '--shard', type=int, default=0,
+        help='Index of the shard processed by this run (default: %(default)s)')
+    parser.add_argument(
+        '--checkpoint_every', type=int, default=100,
+        help='Save the running statistics of the shard every this many batches (default: %(default)s)')
+    parser.add_argument(
+        '--merge_shards', action='store_true', default=False,
+        help='Merge the finished shards and write the moments file (default: %(default)s)')
     return parser
 
 
+# Remove "hdf5" by default (the FID code also knows to strip "hdf5")
+def moments_filename(dataset):
+    return './evaluators/inception_pytorch/' + dataset.strip('_hdf5') + '_inception_moments.npz'
+
+
+def shard_filename(dataset, shard, num_shards):
+    return moments_filename(dataset).replace('.npz', '_shard%dof%d.pth' % (shard, num_shards))
+
+
+def save_moments(config, moments, inception_score):
+    print('Calculating inception metrics...')
+    IS_mean, IS_std = inception_score.compute()
+    print('Training data from dataset %s has IS of %5.5f +/- %5.5f' % (config['dataset'], IS_mean, IS_std))
+    print('Saving calculated means and covariances to disk...')
+    np.savez(moments_filename(config['dataset']),
+             **{'mu': moments.mean.cpu().numpy(), 'sigma': moments.cov.cpu().numpy()})
+
+
 def run(config):
     # Get loader
     config['drop_last'] = False
-    loaders = utils.get_data_loaders(**config)
+    dataset = utils.get_data_loaders(**config)[0].dataset
+    # Sample order is a fixed function of the seed, so a resumed shard skips exactly what it has seen
+    if config['shuffle']:
+        order = torch.randperm(len(dataset), generator=torch.Generator().manual_seed(config['seed'])).tolist()
+    else:
+        order = list(range(len(dataset)))
+    start = len(dataset) * config['shard'] // config['num_shards']
+    end = len(dataset) * (config['shard'] + 1) // config['num_shards']
 
     # Load inception net
-    net = inception_utils.load_inception_net(parallel=config['parallel'])
-    pool, logits, labels = [], [], []
-    device = 'cuda'
-    for i, (x, y) in enumerate(tqdm(loaders[0])):
+    device = config['device']
+    net = inception_utils.load_inception_net(parallel=config['parallel'], device=device)
+    moments = inception_utils.RunningMoments(2048, device)
+    inception_score = inception_utils.RunningInceptionScore(len(dataset), 10, 1000, device, start=start)
+
+    checkpoint = shard_filename(config['dataset'], config['shard'], config['num_shards'])
+    if os.path.exists(checkpoint):
+        state = torch.load(checkpoint)
+        moments.load_state_dict(state['moments'])
+        inception_score.load_state_dict(state['inception_score'])
+        print('Resuming shard %d from %d / %d images...' % (config['shard'], moments.n, end - start))
+
+    def save_checkpoint():
+        torch.save({'moments': moments.state_dict(), 'inception_score': inception_score.state_dict(),
+                    'done': start + moments.n == end}, checkpoint)
+
+    loader = DataLoader(Subset(dataset, order[start + moments.n:end]), batch_size=config['batch_size'],
+                        num_workers=config['num_workers'], pin_memory=True)
+    for i, (x, y) in enumerate(tqdm(loader)):
         x = x.to(device)
         with torch.no_grad():
             pool_val, logits_val = net(x)
-            pool += [np.asarray(pool_val.cpu())]
-            logits += [np.asarray(F.softmax(logits_val, 1).cpu())]
-            labels += [np.asarray(y.cpu())]
-
-    pool, logits, labels = [np.concatenate(item, 0) for item in [pool, logits, labels]]
-    # uncomment to save pool, logits, and labels to disk
-    # print('Saving pool, logits, and labels to disk...')
-    # np.savez(config['dataset']+'_inception_activations.npz',
-    #           {'pool': pool, 'logits': logits, 'labels': labels})
-    # Calculate inception metrics and report them
-    print('Calculating inception metrics...')
-    IS_mean, IS_std = inception_utils.calculate_inception_score(logits)
-    print('Training data from dataset %s has IS of %5.5f +/- %5.5f' % (config['dataset'], IS_mean, IS_std))
-    # Prepare mu and sigma, save to disk. Remove "hdf5" by default
-    # (the FID code also knows to strip "hdf5")
-    print('Calculating means and covariances...')
-    mu, sigma = np.mean(pool, axis=0), np.cov(pool, rowvar=False)
-    print('Saving calculated means and covariances to disk...')
-    np.savez('./evaluators/inception_pytorch/' + config['dataset'].strip('_hdf5') + '_inception_moments.npz',
-             **{'mu': mu, 'sigma': sigma})
+            moments.update(pool_val)
+            inception_score.update(F.softmax(logits_val, 1))
+        if (i + 1) % config['checkpoint_every'] == 0:
+            save_checkpoint()
+
+    if config['num_shards'] == 1:
+        save_moments(config, moments, inception_score)
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    else:
+        save_checkpoint()
+        print('Shard %d / %d done, run with --merge_shards once all shards are done' % (
+            config['shard'], config['num_shards']))
+
+
+def merge_shards(config):
+    moments = inception_utils.RunningMoments(2048)
+    inception_score = None
+    for shard in range(config['num_shards']):
+        state = torch.load(shard_filename(config['dataset'], shard, config['num_shards']))
+        if not state['done']:
+            raise RuntimeError('Shard %d of %s is not finished' % (shard, config['dataset']))
+        shard_moments = inception_utils.RunningMoments(2048)
+        shard_moments.load_state_dict(state['moments'])
+        moments.merge(shard_moments)
+        shard_score = inception_utils.RunningInceptionScore(10, 10, state['inception_score']['sum_probs'].shape[1])
+        shard_score.load_state_dict(state['inception_score'])
+        if inception_score is None:
+            inception_score = shard_score
+        else:
+            inception_score.merge(shard_score)
+    save_moments(config, moments, inception_score)
 
 
 def main():
@@ -87,7 +162,10 @@ def main():
     parser = prepare_parser()
     config = vars(parser.parse_args())
     print(config)
-    run(config)
+    if config['merge_shards']:
+        merge_shards(config)
+    else:
+        run(config)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,9 @@
 ''' Inception utilities
     This file contains methods for calculating IS and FID, using either
     the original numpy code or an accelerated fully-pytorch version that 
-    uses a fast newton-schulz approximation for the matrix sqrt. There are also
+    caches the square root of the reference covariance and takes the trace
+    term from a symmetric eigendecomposition (a fast newton-schulz
+    approximation of the matrix sqrt is kept for comparison). There are also
     methods for acquiring a desired number of samples from the Generator,
     and parallelizing the inbuilt PyTorch inception network.
     
@@ -11,6 +13,7 @@
     numbers. This code tends to produce IS values that are 5-10% lower than
     those obtained through TF. 
 '''
+import contextlib
 import numpy as np
 from scipy import linalg  # For numpy FID
 import time
@@ -25,9 +28,10 @@ from torchvision.models.inception import inception_v3
 # Module that wraps the inception network to enable use with dataparallel and
 # returning pool features and logits.
 class WrapInception(nn.Module):
-    def __init__(self, net):
+    def __init__(self, net, channels_last=False):
         super(WrapInception, self).__init__()
         self.net = net
+        self.channels_last = channels_last
         self.mean = P(torch.tensor([0.485, 0.456, 0.406]).view(1, -1, 1, 1),
                       requires_grad=False)
         self.std = P(torch.tensor([0.229, 0.224, 0.225]).view(1, -1, 1, 1),
@@ -40,6 +44,8 @@ class WrapInception(nn.Module):
         # Upsample if necessary
         if x.shape[2] != 299 or x.shape[3] != 299:
             x = F.interpolate(x, size=(299, 299), mode='bilinear', align_corners=True)
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         # 299 x 299 x 3
         x = self.net.Conv2d_1a_3x3(x)
         # 149 x 149 x 32
@@ -231,6 +237,33 @@ def torch_calculate_frechet_distance(mu1, sigma1, mu2, sigma2, eps=1e-6):
     return out
 
 
+# Frechet Distance against fixed reference moments. The reference sqrt(C_2)
+# is computed once from an eigendecomposition; every call then only needs the
+# eigenvalues of the symmetric PSD matrix sqrt(C_2) C_1 sqrt(C_2), which has
+# the same spectrum as C_1 C_2, so Tr(sqrt(C_1 C_2)) = sum(sqrt(eigenvalues)).
+# This is exact (no Newton-Schulz iterations) and stable (no complex sqrtm).
+class FrechetDistance(object):
+    def __init__(self, mu, sigma, device='cpu'):
+        self.mu = torch.as_tensor(mu, dtype=torch.float64, device=device)
+        sigma = torch.as_tensor(sigma, dtype=torch.float64, device=device)
+        eigenvalues, eigenvectors = torch.linalg.eigh((sigma + sigma.t()) / 2)
+        self.sqrt_sigma = (eigenvectors * eigenvalues.clamp(min=0).sqrt()).mm(eigenvectors.t())
+        self.trace_sigma = torch.trace(sigma)
+
+    def __call__(self, mu, sigma):
+        mu = torch.as_tensor(mu, dtype=torch.float64, device=self.mu.device)
+        sigma = torch.as_tensor(sigma, dtype=torch.float64, device=self.mu.device)
+        assert mu.shape == self.mu.shape, \
+            'Training and test mean vectors have different lengths'
+        assert sigma.shape == self.sqrt_sigma.shape, \
+            'Training and test covariances have different dimensions'
+        diff = mu - self.mu
+        product = self.sqrt_sigma.mm(sigma).mm(self.sqrt_sigma)
+        tr_covmean = torch.linalg.eigvalsh((product + product.t()) / 2).clamp(min=0).sqrt().sum()
+        out = diff.dot(diff) + torch.trace(sigma) + self.trace_sigma - 2 * tr_covmean
+        return float(out.cpu())
+
+
 # Calculate Inception Score mean + std given softmax'd logits and number of splits
 def calculate_inception_score(pred, num_splits=10):
     scores = []
@@ -245,28 +278,313 @@ def calculate_inception_score(pred, num_splits=10):
 # Loop and run the sampler and the net until it accumulates num_inception_images
 # activations. Return the pool, the logits, and the labels (if one wants 
 # Inception Accuracy the labels of the generated class will be needed)
-def accumulate_inception_activations(sample, net, num_inception_images=50000, bs=32):
+def accumulate_inception_activations(sample, net, num_inception_images=50000, bs=32, bf16=False):
     if not len(sample) == num_inception_images:
         raise ValueError('incompatible samples and num_inception_images, '
                          f'lens are {len(sample)} and {num_inception_images}')
+    device = next(net.parameters()).device
     pool, logits = [], []
     sample_idx, count = 0, 0
-    with torch.no_grad():
+    with inference_context(device, bf16):
         while count < num_inception_images:
-            images = sample[sample_idx:sample_idx + bs]
+            images = sample[sample_idx:sample_idx + bs].to(device)
             pool_val, logits_val = net(images)
-            pool += [pool_val]
-            logits += [F.softmax(logits_val, 1)]
+            pool += [pool_val.float()]
+            logits += [F.softmax(logits_val.float(), 1)]
             count += len(pool_val)
             sample_idx = (sample_idx + bs) % len(sample)
     return torch.cat(pool, 0), torch.cat(logits, 0)
 
 
-# Load and wrap the Inception model
-def load_inception_net(parallel=False):
-    inception_model = inception_v3(pretrained=True, transform_input=False).cuda()
-    inception_model = WrapInception(inception_model.eval()).cuda()
-    if parallel:
+# Running mean and covariance of activations in float64. Batches (or whole
+# accumulators) are folded in with Chan et al.'s pairwise update, so memory
+# stays O(dim^2) no matter how many activations are seen.
+class RunningMoments(object):
+    def __init__(self, dim=2048, device='cpu'):
+        self.n = 0
+        self.mean = torch.zeros(dim, dtype=torch.float64, device=device)
+        self.m2 = torch.zeros(dim, dim, dtype=torch.float64, device=device)
+
+    def update(self, x):
+        x = x.double()
+        mean = x.mean(0)
+        centered = x - mean
+        self.merge_stats(x.shape[0], mean, centered.t().mm(centered))
+
+    def merge(self, other):
+        self.merge_stats(other.n, other.mean.to(self.mean.device), other.m2.to(self.m2.device))
+
+    def merge_stats(self, n, mean, m2):
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.m2 = self.m2 + m2 + torch.ger(delta, delta) * (self.n * n / total)
+        self.n = total
+
+    @property
+    def cov(self):
+        return self.m2 / (self.n - 1)
+
+    def state_dict(self):
+        return {'n': self.n, 'mean': self.mean.cpu(), 'm2': self.m2.cpu()}
+
+    def load_state_dict(self, state):
+        self.n = state['n']
+        self.mean = state['mean'].to(self.mean.device, torch.float64)
+        self.m2 = state['m2'].to(self.m2.device, torch.float64)
+
+
+# Running Inception Score statistics: per split, the sum of p(y|x) and the sum
+# of sum_y p(y|x) log p(y|x). Samples are assigned to splits in arrival order
+# exactly like calculate_inception_score chunks them, leftovers are ignored;
+# with keep_leftovers, splits end at i * num_images // num_splits instead, like
+# the TF inception score, so that every image is counted.
+class RunningInceptionScore(object):
+    def __init__(self, num_images, num_splits=10, num_classes=1000, device='cpu', start=0, keep_leftovers=False):
+        if num_images < num_splits:
+            raise ValueError('%d images cannot fill %d inception score splits' % (num_images, num_splits))
+        self.num_images = num_images
+        self.num_splits = num_splits
+        self.split_size = num_images // num_splits
+        self.keep_leftovers = keep_leftovers
+        self.count = start
+        self.split_counts = torch.zeros(num_splits, dtype=torch.float64, device=device)
+        self.sum_probs = torch.zeros(num_splits, num_classes, dtype=torch.float64, device=device)
+        self.sum_neg_entropy = torch.zeros(num_splits, dtype=torch.float64, device=device)
+
+    def update(self, probs):
+        probs = probs.double()
+        indices = torch.arange(self.count, self.count + probs.shape[0], device=probs.device)
+        if self.keep_leftovers:
+            splits = ((indices + 1) * self.num_splits - 1) // self.num_images
+        else:
+            splits = indices // self.split_size
+        self.count += probs.shape[0]
+        keep = splits < self.num_splits
+        probs, splits = probs[keep], splits[keep]
+        self.split_counts.index_add_(0, splits, torch.ones_like(splits, dtype=torch.float64))
+        self.sum_probs.index_add_(0, splits, probs)
+        self.sum_neg_entropy.index_add_(0, splits, (probs * torch.log(probs)).sum(1))
+
+    # merge the statistics of another stream over a disjoint range of sample indices
+    def merge(self, other):
+        self.split_counts += other.split_counts.to(self.split_counts.device)
+        self.sum_probs += other.sum_probs.to(self.sum_probs.device)
+        self.sum_neg_entropy += other.sum_neg_entropy.to(self.sum_neg_entropy.device)
+
+    def state_dict(self):
+        return {'count': self.count, 'split_counts': self.split_counts.cpu(),
+                'sum_probs': self.sum_probs.cpu(), 'sum_neg_entropy': self.sum_neg_entropy.cpu()}
+
+    def load_state_dict(self, state):
+        self.count = state['count']
+        for key in ['split_counts', 'sum_probs', 'sum_neg_entropy']:
+            setattr(self, key, state[key].to(getattr(self, key).device, torch.float64))
+
+    def compute(self):
+        mean_probs = self.sum_probs / self.split_counts.unsqueeze(1)
+        kl_inception = (self.sum_neg_entropy / self.split_counts
+                        - (mean_probs * torch.log(mean_probs)).sum(1))
+        scores = torch.exp(kl_inception)
+        return scores.mean().item(), scores.std(unbiased=False).item()
+
+
+# Loop and run the sampler function and the net until num_inception_images
+# activations are folded into running moments and IS statistics; only one
+# batch of images and activations is alive at a time, besides the first
+# <keep_features> pool features which are returned for KID.
+def accumulate_inception_statistics(sample, net, num_inception_images=50000, num_splits=10, bf16=False,
+                                    keep_features=0):
+    device = next(net.parameters()).device
+    moments, inception_score = None, None
+    features = []
+    count = 0
+    with inference_context(device, bf16):
+        while count < num_inception_images:
+            images = sample()[:num_inception_images - count].to(device)
+            pool_val, logits_val = net(images)
+            pool_val, logits_val = pool_val.float(), logits_val.float()
+            if moments is None:
+                moments = RunningMoments(pool_val.shape[1], pool_val.device)
+                inception_score = RunningInceptionScore(num_inception_images, num_splits,
+                                                        logits_val.shape[1], logits_val.device)
+            moments.update(pool_val)
+            inception_score.update(F.softmax(logits_val, 1))
+            if count < keep_features:
+                features.append(pool_val[:keep_features - count].clone())
+            count += len(pool_val)
+    return moments, inception_score, torch.cat(features) if features else None
+
+
+# Flatten the streamed statistics into numpy arrays for a StatsCache entry, and back.
+def statistics_to_cache(moments, inception_score, features=None):
+    entry = {'moments_' + key: np.asarray(value) for key, value in moments.state_dict().items()}
+    entry.update({'is_' + key: np.asarray(value) for key, value in inception_score.state_dict().items()})
+    if features is not None:
+        entry['features'] = features.cpu().numpy()
+    return entry
+
+
+def statistics_from_cache(entry, num_inception_images, num_splits=10, device='cpu'):
+    moments = RunningMoments(entry['moments_mean'].shape[0], device)
+    moments.load_state_dict({'n': int(entry['moments_n']), 'mean': torch.from_numpy(entry['moments_mean']),
+                             'm2': torch.from_numpy(entry['moments_m2'])})
+    inception_score = RunningInceptionScore(num_inception_images, num_splits, entry['is_sum_probs'].shape[1], device)
+    inception_score.load_state_dict({key: torch.from_numpy(entry['is_' + key]) if key != 'count'
+                                     else int(entry['is_count'])
+                                     for key in ['count', 'split_counts', 'sum_probs', 'sum_neg_entropy']})
+    features = torch.from_numpy(entry['features']).to(device) if 'features' in entry else None
+    return moments, inception_score, features
+
+
+# Running statistics split into <num_blocks> blocks for adaptive evaluation.
+# Batches are dealt to the blocks round-robin; each block is an IS split and
+# a jackknife group for the FID, so confidence intervals are available at any
+# sample count without keeping the activations.
+class BlockedInceptionStatistics(object):
+    def __init__(self, num_blocks=10, dim=2048, num_classes=1000, device='cpu'):
+        self.dim = dim
+        self.device = device
+        self.num_batches = 0
+        self.blocks = [RunningMoments(dim, device) for _ in range(num_blocks)]
+        self.block_counts = torch.zeros(num_blocks, dtype=torch.float64, device=device)
+        self.sum_probs = torch.zeros(num_blocks, num_classes, dtype=torch.float64, device=device)
+        self.sum_neg_entropy = torch.zeros(num_blocks, dtype=torch.float64, device=device)
+
+    @property
+    def n(self):
+        return sum(block.n for block in self.blocks)
+
+    def update(self, pool, probs):
+        block = self.num_batches % len(self.blocks)
+        self.num_batches += 1
+        self.blocks[block].update(pool)
+        probs = probs.double()
+        self.block_counts[block] += probs.shape[0]
+        self.sum_probs[block] += probs.sum(0)
+        self.sum_neg_entropy[block] += (probs * torch.log(probs)).sum()
+
+    def moments(self, exclude=None):
+        moments = RunningMoments(self.dim, self.device)
+        for i, block in enumerate(self.blocks):
+            if i != exclude:
+                moments.merge(block)
+        return moments
+
+    # IS mean and std over the blocks, and the 95% confidence half-width of the mean
+    def inception_score(self):
+        mean_probs = self.sum_probs / self.block_counts.unsqueeze(1)
+        kl_inception = (self.sum_neg_entropy / self.block_counts
+                        - (mean_probs * torch.log(mean_probs)).sum(1))
+        scores = torch.exp(kl_inception)
+        half_width = 1.96 * scores.std().item() / np.sqrt(len(scores))
+        return scores.mean().item(), scores.std(unbiased=False).item(), half_width
+
+    # FID and the 95% confidence half-width of its delete-a-block jackknife estimate
+    def frechet_distance(self, frechet_distance):
+        moments = self.moments()
+        FID = frechet_distance(moments.mean, moments.cov)
+        jackknife = []
+        for i in range(len(self.blocks)):
+            moments = self.moments(exclude=i)
+            jackknife.append(frechet_distance(moments.mean, moments.cov))
+        jackknife = np.array(jackknife)
+        std = np.sqrt((len(jackknife) - 1) / len(jackknife) * ((jackknife - jackknife.mean()) ** 2).sum())
+        return FID, 1.96 * std
+
+
+# Stream samples stage by stage (e.g. 5k, 10k, 20k images) and stop at the
+# first stage whose 95% confidence half-width is below <tolerance>; the FID
+# interval decides if <frechet_distance> is given, the IS interval otherwise.
+def accumulate_adaptive_inception_statistics(sample, net, stages, tolerance, frechet_distance=None,
+                                             num_blocks=10, bf16=False, prints=True, keep_features=0):
+    device = next(net.parameters()).device
+    statistics = None
+    features = []
+    count = 0
+    for stage in stages:
+        with inference_context(device, bf16):
+            while count < stage:
+                images = sample()[:stage - count].to(device)
+                pool_val, logits_val = net(images)
+                pool_val, logits_val = pool_val.float(), logits_val.float()
+                if statistics is None:
+                    statistics = BlockedInceptionStatistics(num_blocks, pool_val.shape[1],
+                                                            logits_val.shape[1], pool_val.device)
+                statistics.update(pool_val, F.softmax(logits_val, 1))
+                if count < keep_features:
+                    features.append(pool_val[:keep_features - count].clone())
+                count += len(pool_val)
+        IS_mean, IS_std, IS_ci = statistics.inception_score()
+        if frechet_distance is None:
+            FID, FID_ci = 9999.0, 0.0
+        else:
+            FID, FID_ci = statistics.frechet_distance(frechet_distance)
+        if prints:
+            print('%d samples: FID %.4f +/- %.4f, IS %.4f +/- %.4f' % (count, FID, FID_ci, IS_mean, IS_ci))
+        if (FID_ci if frechet_distance is not None else IS_ci) < tolerance:
+            break
+    return IS_mean, IS_std, IS_ci, FID, FID_ci, count, torch.cat(features) if features else None
+
+
+# Unbiased estimate of the squared MMD between the rows of x and y with the
+# polynomial kernel k(a, b) = (gamma <a, b> + coef0) ^ degree, gamma = 1 / dim.
+# Kernel sums are accumulated over <block_size> x <block_size> tiles in
+# float64, so memory stays bounded whatever the number of features.
+def polynomial_mmd2(x, y, degree=3, gamma=None, coef0=1, block_size=1024):
+    gamma = 1.0 / x.shape[1] if gamma is None else gamma
+
+    def kernel_sum(a, b, same):
+        total = 0.0
+        for i in range(0, a.shape[0], block_size):
+            a_block = a[i:i + block_size].double()
+            for j in range(0, b.shape[0], block_size):
+                kernel = (gamma * a_block.mm(b[j:j + block_size].double().t()) + coef0) ** degree
+                if same and i == j:
+                    kernel = kernel - torch.diag(torch.diagonal(kernel))
+                total += kernel.sum().item()
+        return total
+
+    m, n = x.shape[0], y.shape[0]
+    return (kernel_sum(x, x, True) / (m * (m - 1)) + kernel_sum(y, y, True) / (n * (n - 1))
+            - 2 * kernel_sum(x, y, False) / (m * n))
+
+
+# Kernel Inception Distance: the unbiased polynomial MMD^2 between generated
+# and real pool features, and its std over <num_subsets> disjoint subsets;
+# fewer subsets are used if needed, so that each one holds 2 samples or more.
+def kernel_inception_distance(gen_features, real_features, num_subsets=10, block_size=1024):
+    num_features = min(gen_features.shape[0], real_features.shape[0])
+    if num_features < 2:
+        raise ValueError('KID needs at least 2 generated and 2 real samples, got %d and %d'
+                         % (gen_features.shape[0], real_features.shape[0]))
+    num_subsets = max(1, min(num_subsets, num_features // 2))
+    KID = polynomial_mmd2(gen_features, real_features, block_size=block_size)
+    subsets = [polynomial_mmd2(x, y, block_size=block_size) for x, y in
+               zip(gen_features.tensor_split(num_subsets), real_features.tensor_split(num_subsets))]
+    return KID, float(np.std(subsets))
+
+
+# Disable autograd (inference mode where available) and optionally autocast
+# the inception net to bf16, which is where most of the CPU speedup comes from.
+def inference_context(device, bf16=False):
+    stack = contextlib.ExitStack()
+    stack.enter_context(torch.inference_mode() if hasattr(torch, 'inference_mode') else torch.no_grad())
+    if bf16:
+        stack.enter_context(torch.autocast(device_type=torch.device(device).type, dtype=torch.bfloat16))
+    return stack
+
+
+# Load and wrap the Inception model on any device; channels_last speeds up
+# the convolutions on CPU (and on GPUs with tensor cores).
+def load_inception_net(parallel=False, device='cuda', channels_last=False):
+    inception_model = inception_v3(pretrained=True, transform_input=False)
+    inception_model = WrapInception(inception_model.eval(), channels_last).to(device)
+    if channels_last:
+        inception_model = inception_model.to(memory_format=torch.channels_last)
+    if parallel and torch.device(device).type == 'cuda':
         print('Parallelizing Inception module...')
         inception_model = nn.DataParallel(inception_model)
     return inception_model
@@ -276,7 +594,10 @@ def load_inception_net(parallel=False):
 # and iterates until it accumulates config['num_inception_images'] images.
 # The iterator can return samples with a different batch size than used in
 # training, using the setting confg['inception_batchsize']
-def prepare_inception_metrics(dataset, parallel, no_is=False, no_fid=False):
+def prepare_inception_metrics(dataset, parallel, no_is=False, no_fid=False, device='cuda',
+                              channels_last=False, bf16=False, num_threads=0,
+                              no_kid=True, kid_size=2000, kid_subsets=10, kid_real_images=None,
+                              cache=None):
     # Load metrics; this is intentionally not in a try-except loop so that
     # the script will crash here if it cannot find the Inception moments.
     if dataset == 'CIFAR10':
@@ -284,13 +605,105 @@ def prepare_inception_metrics(dataset, parallel, no_is=False, no_fid=False):
     data_mu = np.load(f'./evaluators/inception_pytorch/{dataset_name}_inception_moments.npz')['mu']
     data_sigma = np.load(f'./evaluators/inception_pytorch/{dataset_name}_inception_moments.npz')['sigma']
     # Load network
-    net = load_inception_net(parallel)
-
+    net = load_inception_net(parallel, device, channels_last)
+    frechet_distance = FrechetDistance(data_mu, data_sigma, device)
+    # pool features of <kid_size> real images, computed at the first KID evaluation
+    real_features = []
+
+    def kernel_inception_distance_to_real(gen_features):
+        if not real_features:
+            real_images = kid_real_images()
+            real_features.append(accumulate_inception_activations(real_images, net, len(real_images), bf16=bf16)[0])
+        return kernel_inception_distance(gen_features, real_features[0], kid_subsets)
+
+    # <sample> is either a tensor of num_inception_images samples, or a function
+    # returning a fresh batch of samples, which is evaluated in a streaming way.
+    # The images per second of the last inception pass are kept in
+    # get_inception_metrics.images_per_second to size evaluation workers.
+    # With <stages> and a positive <tolerance>, a streamed evaluation stops at
+    # the first stage whose 95% confidence interval is narrower than tolerance;
+    # the sample count used and the interval half-widths are kept in
+    # get_inception_metrics.num_samples / .FID_ci / .IS_ci.
+    # Unless no_kid, the KID mean and std on the first kid_size samples are kept
+    # in get_inception_metrics.KID, against the real images from kid_real_images().
+    # A positive num_threads sets torch's (process-wide) thread count during the
+    # evaluation, so it must be 0 when the evaluation runs beside training.
+    # A streamed evaluation whose samples are fully determined by <cache_key>
+    # (e.g. a hash of the generator weights and the sampling seed) looks its
+    # statistics up in <cache>, a util.stats_cache.StatsCache, before running.
     def get_inception_metrics(sample, num_inception_images, num_splits=10,
-                              prints=True, use_torch=True):
+                              prints=True, use_torch=True, stages=None, tolerance=0, cache_key=None):
+        default_num_threads = torch.get_num_threads()
+        if num_threads > 0:
+            torch.set_num_threads(num_threads)
+        get_inception_metrics.num_samples = num_inception_images
+        get_inception_metrics.FID_ci = get_inception_metrics.IS_ci = None
+        get_inception_metrics.KID = None
+        try:
+            return _get_inception_metrics(sample, num_inception_images, num_splits, prints, use_torch,
+                                          stages, tolerance, cache_key)
+        finally:
+            torch.set_num_threads(default_num_threads)
+
+    def _get_inception_metrics(sample, num_inception_images, num_splits, prints, use_torch, stages, tolerance,
+                               cache_key):
+        start_time = time.time()
+        if callable(sample) and stages and tolerance > 0:
+            stages = sorted(stage for stage in stages if stage < num_inception_images) + [num_inception_images]
+            IS_mean, IS_std, IS_ci, FID, FID_ci, count, features = accumulate_adaptive_inception_statistics(
+                sample, net, stages, tolerance, None if no_fid else frechet_distance, num_splits, bf16, prints,
+                keep_features=0 if no_kid else kid_size)
+            get_inception_metrics.images_per_second = count / (time.time() - start_time)
+            get_inception_metrics.num_samples = count
+            get_inception_metrics.FID_ci, get_inception_metrics.IS_ci = FID_ci, IS_ci
+            if not no_kid:
+                get_inception_metrics.KID = kernel_inception_distance_to_real(features)
+            if no_is:
+                IS_mean, IS_std = 0, 1
+            return IS_mean, IS_std, FID
+
+        if callable(sample):
+            if prints:
+                print('Streaming activations...')
+            keep_features = 0 if no_kid else kid_size
+            entry = None
+            if cache is not None and cache_key:
+                cache_key = '%s_n%d_s%d_k%d%s' % (cache_key, num_inception_images, num_splits, keep_features,
+                                                  '_bf16' if bf16 else '')
+                entry = cache.get(cache_key)
+            if entry is not None:
+                if prints:
+                    print('Loaded cached statistics %s' % cache_key)
+                moments, inception_score, features = statistics_from_cache(
+                    entry, num_inception_images, num_splits, device)
+            else:
+                moments, inception_score, features = accumulate_inception_statistics(
+                    sample, net, num_inception_images, num_splits, bf16, keep_features)
+                if cache is not None and cache_key:
+                    cache.put(cache_key, **statistics_to_cache(moments, inception_score, features))
+            get_inception_metrics.images_per_second = num_inception_images / (time.time() - start_time)
+            if prints:
+                print('%.1f images / s' % get_inception_metrics.images_per_second)
+            if not no_kid:
+                get_inception_metrics.KID = kernel_inception_distance_to_real(features)
+            IS_mean, IS_std = (0, 1) if no_is else inception_score.compute()
+            if no_fid:
+                FID = 9999.0
+            elif use_torch:
+                FID = frechet_distance(moments.mean, moments.cov)
+            else:
+                FID = numpy_calculate_frechet_distance(moments.mean.cpu().numpy(), moments.cov.cpu().numpy(),
+                                                       data_mu, data_sigma)
+            return IS_mean, IS_std, FID
+
         if prints:
             print('Gathering activations...')
-        pool, logits = accumulate_inception_activations(sample, net, num_inception_images)
+        pool, logits = accumulate_inception_activations(sample, net, num_inception_images, bf16=bf16)
+        get_inception_metrics.images_per_second = num_inception_images / (time.time() - start_time)
+        if prints:
+            print('%.1f images / s' % get_inception_metrics.images_per_second)
+        if not no_kid:
+            get_inception_metrics.KID = kernel_inception_distance_to_real(pool[:kid_size])
         if prints:
             print('Calculating Inception Score...')
         if no_is:
@@ -310,9 +723,7 @@ def prepare_inception_metrics(dataset, parallel, no_is=False, no_fid=False):
             if prints:
                 print('Covariances calculated, getting FID...')
             if use_torch:
-                FID = torch_calculate_frechet_distance(mu, sigma, torch.tensor(data_mu).float().cuda(),
-                                                       torch.tensor(data_sigma).float().cuda())
-                FID = float(FID.cpu().numpy())
+                FID = frechet_distance(mu, sigma)
             else:
                 FID = numpy_calculate_frechet_distance(mu.cpu().numpy(), sigma.cpu().numpy(), data_mu, data_sigma)
         return IS_mean, IS_std, FID
@@ -481,18 +481,25 @@ class RandomCropLongEdge(object):
 class MultiEpochSampler(torch.utils.data.Sampler):
   r"""Samples elements randomly over multiple epochs
 
+  Each epoch's permutation is drawn from its own generator, seeded with
+  seed + epoch, only when the epoch is reached; so memory is O(n) and
+  resuming at start_itr yields exactly the remaining indices.
+
   Arguments:
       data_source (Dataset): dataset to sample from
       num_epochs (int) : Number of times to loop over the dataset
       start_itr (int) : which iteration to begin from
+      seed (int) : base seed of the epoch permutations, drawn from the
+          global torch RNG if None (so torch.manual_seed still fixes it)
   """
 
-  def __init__(self, data_source, num_epochs, start_itr=0, batch_size=128):
+  def __init__(self, data_source, num_epochs, start_itr=0, batch_size=128, seed=None):
     self.data_source = data_source
     self.num_samples = len(self.data_source)
     self.num_epochs = num_epochs
     self.start_itr = start_itr
     self.batch_size = batch_size
+    self.seed = int(torch.randint(2 ** 31, (1,)).item()) if seed is None else seed
 
     if not isinstance(self.num_samples, int) or self.num_samples <= 0:
       raise ValueError("num_samples should be a positive integeral "
@@ -500,21 +507,15 @@ class MultiEpochSampler(torch.utils.data.Sampler):
 
   def __iter__(self):
     n = len(self.data_source)
-    # Determine number of epochs
-    num_epochs = int(np.ceil((n * self.num_epochs 
-                              - (self.start_itr * self.batch_size)) / float(n)))
-    # Sample all the indices, and then grab the last num_epochs index sets;
-    # This ensures if we're starting at epoch 4, we're still grabbing epoch 4's
-    # indices
-    out = [torch.randperm(n) for epoch in range(self.num_epochs)][-num_epochs:]
-    # Ignore the first start_itr % n indices of the first epoch
-    out[0] = out[0][(self.start_itr * self.batch_size % n):]
-    # if self.replacement:
-      # return iter(torch.randint(high=n, size=(self.num_samples,), dtype=torch.int64).tolist())
-    # return iter(.tolist())
-    output = torch.cat(out).tolist()
-    print('Length dataset output is %d' % len(output))
-    return iter(output)
+    # Skip the epochs and the first indices of the epoch that start_itr is in
+    start_epoch, start_idx = divmod(self.start_itr * self.batch_size, n)
+    print('Length dataset output is %d' % len(self))
+    for epoch in range(start_epoch, self.num_epochs):
+      generator = torch.Generator().manual_seed(self.seed + epoch)
+      perm = torch.randperm(n, generator=generator)
+      if epoch == start_epoch:
+        perm = perm[start_idx:]
+      yield from perm.tolist()
 
   def __len__(self):
     return len(self.data_source) * self.num_epochs - self.start_itr * self.batch_size
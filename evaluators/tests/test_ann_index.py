@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import torch
+
+from ..ann_index import IVFIndex, kmeans
+
+
+class IVFIndexTest(TestCase):
+
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.vecs = torch.randn([2000, 32])
+        self.vecs = self.vecs / self.vecs.norm(2, dim=-1, keepdim=True)
+        self.query = self.vecs[:100] + 0.1 * torch.randn([100, 32])
+
+    def test_kmeans_assignment(self):
+        centroids, assignment = kmeans(self.vecs, 16, n_iter=5)
+        self.assertEqual(centroids.shape, (16, 32))
+        distance = ((self.vecs.unsqueeze(1) - centroids.unsqueeze(0)) ** 2).sum(-1)
+        self.assertTrue(torch.all(distance.argmin(1) == assignment))
+
+    def test_kmeans_warm_start(self):
+        centroids, _ = kmeans(self.vecs, 16, n_iter=5)
+        warm_centroids, assignment = kmeans(self.vecs + 0.01, 64, n_iter=1, init=centroids)
+        self.assertEqual(warm_centroids.shape, (16, 32))
+        distance = ((self.vecs.unsqueeze(1) + 0.01 - warm_centroids.unsqueeze(0)) ** 2).sum(-1)
+        self.assertTrue(torch.all(distance.argmin(1) == assignment))
+
+    def test_exhaustive_probe_is_exact(self):
+        index = IVFIndex(self.vecs, n_lists=16, n_probe=16)
+        scores, idx = index.search(self.query, 5)
+        exact_scores, exact_idx = index.exact_search(self.query, 5)
+        self.assertTrue(torch.allclose(scores, exact_scores, atol=1e-5))
+        self.assertEqual(index.recall(self.query, 5), 1.)
+
+    def test_pq_rerank(self):
+        index = IVFIndex(self.vecs, n_lists=16, n_probe=16, pq_m=8, pq_bits=4, rerank=50)
+        _, idx = index.search(self.query, 1)
+        self.assertGreater((idx[:, 0] == torch.arange(100)).float().mean().item(), 0.9)
+
+    def test_full_rerank_is_exact(self):
+        index = IVFIndex(self.vecs, n_lists=16, n_probe=16, pq_m=8, pq_bits=4, rerank=2000)
+        self.assertEqual(index.recall(self.query, 5), 1.)
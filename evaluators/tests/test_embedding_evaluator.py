@@ -18,3 +18,38 @@ class EmbeddingEvaluatorTest(TestCase):
         b = a
         distance = EmbeddingEvaluator.cosine_distance(a, b)
         self.assertTrue(torch.all(distance.diagonal() < 1e-5))
+
+    def test_get_nn_avg_dist_on_query_subset(self):
+        emb = torch.rand([200, 16])
+        query = torch.rand([150, 16])
+        idx = torch.tensor([3, 17, 42, 99, 149])
+        full = EmbeddingEvaluator.get_nn_avg_dist(emb, query, 5, 32)
+        subset = EmbeddingEvaluator.get_nn_avg_dist(emb, query[idx], 5, 32)
+        self.assertTrue(torch.allclose(full[idx], subset))
+
+    def test_bidirectional_nn_avg_dist(self):
+        emb1 = torch.rand([130, 16])
+        emb2 = torch.rand([70, 16])
+        dist1, dist2 = EmbeddingEvaluator.get_bidirectional_nn_avg_dist(emb1, emb2, 5, tile_size=32)
+        self.assertTrue(torch.allclose(dist1, EmbeddingEvaluator.get_nn_avg_dist(emb2, emb1, 5, 32)))
+        self.assertTrue(torch.allclose(dist2, EmbeddingEvaluator.get_nn_avg_dist(emb1, emb2, 5, 32)))
+
+    def test_rescore_in_memory_budget(self):
+        query = torch.rand([40, 16])
+        emb = torch.rand([90, 16])
+        candidates = torch.randint(90, (40, 7), dtype=torch.int32)
+        exact = (query.unsqueeze(1) * emb[candidates.long()]).sum(-1)
+        rescored = EmbeddingEvaluator.rescore(query, emb, candidates, max_memory=3 * 7 * 16 * 4)
+        self.assertTrue(torch.allclose(rescored, exact))
+
+    def test_low_precision_bidirectional_nn_avg_dist(self):
+        # a shortlist much smaller than the vocabularies, so that the rescoring path is exercised
+        torch.manual_seed(0)
+        emb1 = torch.rand([1000, 16])
+        emb2 = torch.rand([1200, 16])
+        exact1, exact2 = EmbeddingEvaluator.get_bidirectional_nn_avg_dist(emb1, emb2, 5, tile_size=256)
+        dist1, dist2 = EmbeddingEvaluator.get_bidirectional_nn_avg_dist(
+            emb1, emb2, 5, tile_size=256, precision='bf16', shortlist=20,
+        )
+        self.assertTrue(torch.allclose(dist1, exact1, atol=1e-4))
+        self.assertTrue(torch.allclose(dist2, exact2, atol=1e-4))
@@ -0,0 +1,111 @@
+from unittest import TestCase
+
+import numpy as np
+import torch
+
+from evaluators.inception_pytorch import inception_utils
+
+
+class RunningStatisticsTest(TestCase):
+
+    def test_running_moments(self):
+        pool = torch.randn([1000, 16])
+        moments = inception_utils.RunningMoments(16)
+        for batch in pool.split(64):
+            moments.update(batch)
+        self.assertEqual(moments.n, 1000)
+        self.assertTrue(np.allclose(moments.mean.numpy(), pool.double().mean(0).numpy()))
+        self.assertTrue(np.allclose(moments.cov.numpy(), np.cov(pool.double().numpy(), rowvar=False)))
+
+    def test_running_inception_score(self):
+        probs = torch.softmax(torch.randn([1000, 20]), 1)
+        inception_score = inception_utils.RunningInceptionScore(1000, num_splits=10, num_classes=20)
+        for batch in probs.split(64):
+            inception_score.update(batch)
+        expected = inception_utils.calculate_inception_score(probs.double().numpy(), num_splits=10)
+        self.assertTrue(np.allclose(inception_score.compute(), expected))
+
+    def test_running_inception_score_keeps_leftovers(self):
+        probs = torch.softmax(torch.randn([1003, 20]), 1).double()
+        inception_score = inception_utils.RunningInceptionScore(1003, num_splits=10, num_classes=20,
+                                                                keep_leftovers=True)
+        for batch in probs.split(64):
+            inception_score.update(batch)
+        self.assertEqual(inception_score.split_counts.sum().item(), 1003)
+        # the splits of the TF inception score
+        scores = []
+        for i in range(10):
+            part = probs[i * 1003 // 10:(i + 1) * 1003 // 10]
+            kl = part * (torch.log(part) - torch.log(part.mean(0, keepdim=True)))
+            scores.append(torch.exp(kl.sum(1).mean()).item())
+        self.assertTrue(np.allclose(inception_score.compute(), (np.mean(scores), np.std(scores))))
+        with self.assertRaises(ValueError):
+            inception_utils.RunningInceptionScore(9, num_splits=10)
+
+    def test_merge_shards(self):
+        pool = torch.randn([1000, 16])
+        probs = torch.softmax(torch.randn([1000, 20]), 1)
+        moments = inception_utils.RunningMoments(16)
+        inception_score = None
+        for start, end in [(0, 300), (300, 1000)]:
+            shard_moments = inception_utils.RunningMoments(16)
+            shard_score = inception_utils.RunningInceptionScore(1000, num_splits=10, num_classes=20, start=start)
+            for batch in range(start, end, 64):
+                shard_moments.update(pool[batch:min(batch + 64, end)])
+                shard_score.update(probs[batch:min(batch + 64, end)])
+            # round trip through a checkpoint
+            restored = inception_utils.RunningMoments(16)
+            restored.load_state_dict(shard_moments.state_dict())
+            moments.merge(restored)
+            if inception_score is None:
+                inception_score = shard_score
+            else:
+                inception_score.merge(shard_score)
+        self.assertTrue(np.allclose(moments.cov.numpy(), np.cov(pool.double().numpy(), rowvar=False)))
+        expected = inception_utils.calculate_inception_score(probs.double().numpy(), num_splits=10)
+        self.assertTrue(np.allclose(inception_score.compute(), expected))
+
+    def test_blocked_statistics(self):
+        pool = torch.randn([1000, 16])
+        probs = torch.softmax(torch.randn([1000, 20]), 1)
+        statistics = inception_utils.BlockedInceptionStatistics(num_blocks=10, dim=16, num_classes=20)
+        for pool_batch, probs_batch in zip(pool.split(50), probs.split(50)):
+            statistics.update(pool_batch, probs_batch)
+        self.assertEqual(statistics.n, 1000)
+        self.assertTrue(np.allclose(statistics.moments().cov.numpy(), np.cov(pool.double().numpy(), rowvar=False)))
+        # batches are dealt round-robin, block i holds batches i, i + 10
+        order = torch.arange(20).view(2, 10).t().flatten()
+        blocked_probs = torch.cat([probs.split(50)[i] for i in order])
+        expected = inception_utils.calculate_inception_score(blocked_probs.double().numpy(), num_splits=10)
+        self.assertTrue(np.allclose(statistics.inception_score()[:2], expected))
+
+
+class FrechetDistanceTest(TestCase):
+
+    def test_matches_numpy(self):
+        rng = np.random.RandomState(0)
+        pool1, pool2 = rng.randn(500, 32), rng.randn(500, 32).dot(rng.rand(32, 32)) + 0.5
+        mu1, sigma1 = pool1.mean(0), np.cov(pool1, rowvar=False)
+        mu2, sigma2 = pool2.mean(0), np.cov(pool2, rowvar=False)
+        frechet_distance = inception_utils.FrechetDistance(mu2, sigma2)
+        expected = inception_utils.numpy_calculate_frechet_distance(mu1, sigma1, mu2, sigma2)
+        self.assertAlmostEqual(frechet_distance(mu1, sigma1), expected, places=6)
+        self.assertAlmostEqual(frechet_distance(mu2, sigma2), 0, places=6)
+
+
+class KernelInceptionDistanceTest(TestCase):
+
+    def test_block_wise_mmd(self):
+        x, y = torch.randn([300, 8]), torch.randn([200, 8]) + 0.5
+        kernel = lambda a, b: (a.double().mm(b.double().t()) / 8 + 1) ** 3
+        k_xx, k_yy, k_xy = kernel(x, x), kernel(y, y), kernel(x, y)
+        expected = ((k_xx.sum() - k_xx.trace()) / (300 * 299) + (k_yy.sum() - k_yy.trace()) / (200 * 199)
+                    - 2 * k_xy.mean()).item()
+        self.assertAlmostEqual(inception_utils.polynomial_mmd2(x, y, block_size=64), expected, places=8)
+
+    def test_few_samples(self):
+        x, y = torch.randn([7, 8]), torch.randn([9, 8])
+        KID, KID_std = inception_utils.kernel_inception_distance(x, y, num_subsets=10)  # 3 subsets of 2-3
+        self.assertTrue(np.isfinite(KID) and np.isfinite(KID_std))
+        with self.assertRaises(ValueError):
+            inception_utils.kernel_inception_distance(x[:1], y)
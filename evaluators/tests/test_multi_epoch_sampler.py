@@ -0,0 +1,27 @@
+import os
+import sys
+from unittest import TestCase
+
+# the BigGAN utilities are run as scripts from their own directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'inception_pytorch'))
+from utils import MultiEpochSampler  # noqa: E402
+
+
+class MultiEpochSamplerTest(TestCase):
+
+    def test_every_index_once_per_epoch(self):
+        sampler = MultiEpochSampler(range(50), num_epochs=3, batch_size=8, seed=0)
+        indices = list(sampler)
+        self.assertEqual(len(indices), len(sampler))
+        self.assertEqual(len(sampler), 150)
+        for epoch in range(3):
+            self.assertEqual(sorted(indices[epoch * 50:(epoch + 1) * 50]), list(range(50)))
+        self.assertNotEqual(indices[:50], indices[50:100])
+
+    def test_reproducible_and_resumable(self):
+        indices = list(MultiEpochSampler(range(50), num_epochs=3, batch_size=8, seed=7))
+        self.assertEqual(list(MultiEpochSampler(range(50), num_epochs=3, batch_size=8, seed=7)), indices)
+        self.assertNotEqual(list(MultiEpochSampler(range(50), num_epochs=3, batch_size=8, seed=8)), indices)
+        resumed = MultiEpochSampler(range(50), num_epochs=3, start_itr=9, batch_size=8, seed=7)
+        self.assertEqual(len(resumed), 150 - 72)
+        self.assertEqual(list(resumed), indices[72:])
@@ -2,6 +2,9 @@ import os
 import torch
 from abc import ABC, abstractmethod
 from models.networks import networks
+from models.networks.loss import cal_gradient_penalty
+from models.networks.utils import fused_D_forward
+from util.image_pool import ImagePool
 
 from collections import OrderedDict
 
@@ -42,6 +45,11 @@ class BaseModel(ABC):
         self.optimizers = []
         self.metric = 0  # used for learning rate policy 'plateau'
         self.step = 0  # counter for training steps
+        self.fakes_D = None  # fake batch of the current D steps, see get_D_fakes
+        self.num_D_steps = 0  # counter for the D steps, see optimize_D
+        self.batch_size = opt.batch_size  # # of samples generated by forward, that of the micro-batch in a step
+        if self.isTrain:
+            self.fake_pool = ImagePool(opt.pool_size)  # history of fakes fed to netD, see backward_D
 
     @staticmethod
     def modify_commandline_options(parser, is_train):
@@ -82,6 +90,118 @@ class BaseModel(ABC):
         """Calculate losses, gradients, and update network weights; called in every training iteration"""
         pass
 
+    def get_D_fakes(self) -> dict:
+        """Generate the fake batch of a D step.
+
+        netG is not differentiated in D steps, so the batch is generated without building its graph.
+        With --reuse_fakes, the batch of the first D step after a G step is reused by the next D steps
+        (netG is unchanged until the next G step).
+        """
+        first_D_step = self.step % (self.opt.D_iters + 1) == 1
+        if self.opt.reuse_fakes and self.fakes_D is not None and not first_D_step:
+            return self.fakes_D
+        with torch.no_grad():
+            fakes = [self.forward() for _ in self.micro_batches()]
+        if len(fakes) == 1:
+            self.fakes_D = fakes[0]
+        else:
+            self.fakes_D = {key: torch.cat([fake[key] for fake in fakes]) for key in fakes[0]}
+            self.set_output(self.fakes_D['data'])
+        return self.fakes_D
+
+    def optimize_D(self):
+        """One D step: backward_D on each micro-batch of the fake and the real batch, then one update of netD"""
+        gen_data = self.get_D_fakes()
+        self.set_requires_grad(self.netD, True)
+        self.optimizer_D.zero_grad()
+        self.backward_micro_batches(self.backward_D, gen_data, loss_names=['D_real', 'D_fake', 'D_gp', 'D'])
+        self.optimizer_D.step()
+        self.num_D_steps += 1
+
+    def micro_batches(self, *batches):
+        """Split the step into micro-batches of --micro_batch_size samples, so that memory is bounded by them.
+
+        Yields (weight, micro_batches): the share of the micro-batch in the step and the slices of batches
+        (dicts of tensors). Meanwhile, self.inputs holds the slice of the real batch and forward() generates
+        as many samples. Without --micro_batch_size, the whole step is one micro-batch of weight 1.
+        """
+        micro_batch_size = self.opt.micro_batch_size
+        if not micro_batch_size or micro_batch_size >= self.batch_size:
+            yield 1., list(batches)
+            return
+        inputs, batch_size = self.inputs, self.batch_size
+        try:
+            for start in range(0, batch_size, micro_batch_size):
+                end = min(start + micro_batch_size, batch_size)
+                self.inputs = {key: value[start:end] for key, value in inputs.items()}
+                self.batch_size = end - start
+                yield (end - start) / batch_size, [{key: value[start:end] for key, value in batch.items()}
+                                                   for batch in batches]
+        finally:
+            self.inputs, self.batch_size = inputs, batch_size
+
+    def backward_micro_batches(self, backward, *batches, loss_names=()):
+        """Call backward(*micro_batches, weight) on each micro-batch of the step, accumulating the gradients.
+
+        backward weights its loss by weight before calling .backward(). Returns the losses dict returned by backward,
+        summed over the micro-batches with their weights; the loss_<name> attributes of loss_names are summed too.
+        """
+        total = None
+        for weight, micro_batches in self.micro_batches(*batches):
+            losses = backward(*micro_batches, weight)
+            if weight == 1.:  # the step is a single micro-batch, the losses are left as they are
+                return losses
+            losses = dict(losses or {}, **{name: getattr(self, 'loss_' + name) for name in loss_names})
+            total = self.add_losses(total, losses, weight)
+        for name in loss_names:
+            setattr(self, 'loss_' + name, total.pop(name))
+        return total or None
+
+    @staticmethod
+    def add_losses(total, losses, weight):
+        """Add the losses of a micro-batch, weighted, to the total (None at first); other entries are copied"""
+        total = {} if total is None else total
+        for key, value in losses.items():
+            if isinstance(value, torch.Tensor):
+                value = value.detach()
+            if isinstance(value, (float, torch.Tensor)):
+                total[key] = total.get(key, 0.) + weight * value
+            else:  # e.g. the loss mode
+                total[key] = value
+        return total
+
+    def run_D(self, real_data, gen_data):
+        """Return the outputs of netD on the real and the fake batch.
+
+        With --fuse_D, the 'data' of both batches is concatenated and goes through netD in one call,
+        which halves the kernel launches of small discriminators; batch norm layers still normalize
+        the real and the fake half with their own statistics.
+        """
+        if not self.opt.fuse_D:
+            return self.netD(real_data), self.netD(gen_data)
+        return fused_D_forward(self.netD, real_data, gen_data)
+
+    def gradient_penalty(self, real_data, fake_data):
+        """Return the gradient penalty of a D step (0 without --use_gp).
+
+        --gp_type wgangp penalizes the gradient norm of D at real-fake interpolates toward 1 (WGAN-GP, weight 10),
+        r1 penalizes it at the real samples toward 0 (R1, gamma 10, i.e. weight 5).
+        With --gp_every k, the penalty is only computed every k D steps, with its weight multiplied by k
+        (lazy regularization), which saves most of the double backpropagation through netD.
+        """
+        if not self.opt.use_gp:
+            return 0.
+        if self.num_D_steps % self.opt.gp_every != 0:
+            return 0.
+        if self.opt.gp_type == 'wgangp':
+            penalty_type, constant, lambda_gp = 'mixed', 1.0, 10.0
+        elif self.opt.gp_type == 'r1':
+            penalty_type, constant, lambda_gp = 'real', 0.0, 5.0
+        else:
+            raise NotImplementedError('gradient penalty [%s] is not implemented' % self.opt.gp_type)
+        return cal_gradient_penalty(self.netD, real_data, fake_data, self.device, type=penalty_type,
+                                    constant=constant, lambda_gp=lambda_gp * self.opt.gp_every)[0]
+
     def get_device(self):
         return self.device
 
@@ -18,7 +18,7 @@ You need to implement the following functions:
 import torch
 from .base_model import BaseModel
 from models.networks import networks
-from models.networks.loss import GANLoss, cal_gradient_penalty
+from models.networks.loss import GANLoss
 from models.networks.utils import get_prior
 from util.util import one_hot
 from .utils import (
@@ -110,9 +110,9 @@ class EGANModel(BaseModel):
 
 
     def forward(self) -> dict:
-        batch_size = self.opt.batch_size
+        batch_size = self.batch_size
         if self.opt.gan_mode == "conditional":
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             y = self.CatDis.sample([batch_size])
             y = one_hot(y, [batch_size, self.opt.cat_num])
             gen_data = self.netG(z, y)
@@ -123,7 +123,7 @@ class EGANModel(BaseModel):
             self.set_output(gen_data)
             return {'data': gen_data}
         elif self.opt.gan_mode == 'unconditional-z':
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             gen_data = self.netG(z)
             self.set_output(gen_data)
             return {'data': gen_data}
@@ -136,14 +136,13 @@ class EGANModel(BaseModel):
     def get_output(self):
         return self.output
 
-    def backward_G(self, gen_data, criterion) -> dict:
+    def backward_G(self, gen_data, criterion, weight=1.) -> dict:
         # pass D
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
 
         loss_G_fake, loss_G_real = criterion(fake_out, real_out) 
         loss_G = loss_G_fake + loss_G_real
-        loss_G.backward()
+        (weight * loss_G).backward()
 
         return {
             '': loss_G,
@@ -152,38 +151,23 @@ class EGANModel(BaseModel):
             'mode': self.loss_mode_to_idx[criterion.loss_mode]
         }
 
-    def backward_D(self, gen_data):
+    def backward_D(self, gen_data, weight=1.):
+        gen_data = self.fake_pool.query(gen_data)
         # pass D 
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
 
         self.loss_D_fake, self.loss_D_real = self.criterionD(fake_out, real_out)
-        if self.opt.use_gp is True:
-            self.loss_D_gp = cal_gradient_penalty(
-                self.netD,
-                self.inputs['data'],
-                gen_data['data'],
-                self.device,
-                type='mixed',
-                constant=1.0,
-                lambda_gp=10.0,
-            )[0]
-        else:
-            self.loss_D_gp = 0.
+        self.loss_D_gp = self.gradient_penalty(self.inputs['data'], gen_data['data'])
 
         self.loss_D = self.loss_D_fake + self.loss_D_real + self.loss_D_gp
-        self.loss_D.backward()
+        (weight * self.loss_D).backward()
 
     def optimize_parameters(self):
         if self.step % (self.opt.D_iters + 1) == 0:
             self.set_requires_grad(self.netD, False)
             self.G_candis, self.opt_G_candis, self.loss_G = self.Evo_G(self.G_candis, self.optG_candis)
         else:
-            gen_data = self.forward()
-            self.set_requires_grad(self.netD, True)
-            self.optimizer_D.zero_grad()
-            self.backward_D(gen_data)
-            self.optimizer_D.step()
+            self.optimize_D()
 
         self.step += 1
 
@@ -203,16 +187,18 @@ class EGANModel(BaseModel):
                 self.netG.load_state_dict(G_candi)
                 self.optimizer_G.load_state_dict(optG_candi)
                 self.optimizer_G.zero_grad()
-                gen_data = self.forward() 
-                G_losses = self.backward_G(gen_data, criterionG)
+                G_losses = self.backward_micro_batches(
+                    lambda weight: self.backward_G(self.forward(), criterionG, weight))
                 self.optimizer_G.step()
                 if self.opt.dataset_mode == 'embedding' and not self.opt.exact_orthogonal:
                     self.orthogonalize(self.netG)
 
                 # Evaluation
-                with torch.no_grad():
-                    eval_data = self.forward()
-                fitness = self.fitness_score(eval_data)
+                fitness = 0.
+                for weight, _ in self.micro_batches():
+                    with torch.no_grad():
+                        eval_data = self.forward()
+                    fitness += weight * self.fitness_score(eval_data)
 
                 # Selection
                 if fitness > G_heap.top().fitness:
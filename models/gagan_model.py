@@ -13,7 +13,7 @@ from .utils import (
 )
 from .optimizers import get_optimizer
 from models.networks import networks
-from models.networks.loss import GANLoss, cal_gradient_penalty
+from models.networks.loss import GANLoss
 from models.networks.utils import get_prior
 from util.util import one_hot
 
@@ -76,9 +76,9 @@ class GAGANModel(BaseModel):
         self.optG_candis = [copy.deepcopy(self.optimizer_G.state_dict())] * opt.candi_num
 
     def forward(self) -> dict:
-        batch_size = self.opt.batch_size
+        batch_size = self.batch_size
         if self.opt.gan_mode == "conditional":
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             y = self.CatDis.sample([batch_size])
             y = one_hot(y, [batch_size, self.opt.cat_num])
             gen_data = self.netG(z, y)
@@ -89,7 +89,7 @@ class GAGANModel(BaseModel):
             self.set_output(gen_data)
             return {'data': gen_data}
         elif self.opt.gan_mode == 'unconditional-z':
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             gen_data = self.netG(z)
             self.set_output(gen_data)
             return {'data': gen_data}
@@ -102,10 +102,9 @@ class GAGANModel(BaseModel):
     def get_output(self):
         return self.output
 
-    def backward_G(self, gen_data, criterion) -> dict:
+    def backward_G(self, gen_data, criterion, weight=1.) -> dict:
         # pass D
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
 
         loss_G_fake, loss_G_real = criterion(fake_out, real_out)
         if self.opt.dataset_mode == 'embedding' and not self.opt.exact_orthogonal:
@@ -117,7 +116,7 @@ class GAGANModel(BaseModel):
         else:
             loss_G_orthogonal = 0.
         loss_G = loss_G_fake + loss_G_real + loss_G_orthogonal
-        loss_G.backward()
+        (weight * loss_G).backward()
 
         return {
             '': loss_G,
@@ -127,27 +126,16 @@ class GAGANModel(BaseModel):
             'mode': criterion.loss_mode,
         }
 
-    def backward_D(self, gen_data):
+    def backward_D(self, gen_data, weight=1.):
+        gen_data = self.fake_pool.query(gen_data)
         # pass D 
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
 
         self.loss_D_fake, self.loss_D_real = self.criterionD(fake_out, real_out)
-        if self.opt.use_gp is True:
-            self.loss_D_gp = cal_gradient_penalty(
-                self.netD,
-                self.inputs['data'],
-                gen_data['data'],
-                self.device,
-                type='mixed',
-                constant=1.0,
-                lambda_gp=10.0,
-            )[0]
-        else:
-            self.loss_D_gp = 0.
+        self.loss_D_gp = self.gradient_penalty(self.inputs['data'], gen_data['data'])
 
         self.loss_D = self.loss_D_fake + self.loss_D_real + self.loss_D_gp
-        self.loss_D.backward()
+        (weight * self.loss_D).backward()
 
     def optimize_parameters(self):
         if self.step % (self.opt.D_iters + 1) == 0:
@@ -156,11 +144,7 @@ class GAGANModel(BaseModel):
             self.G_candis, self.opt_G_candis, xo_success_rate = self.crossover(self.G_candis, self.optG_candis)
             self.loss_G = {'xo_success_rate': xo_success_rate, **self.loss_G}
         else:
-            gen_data = self.forward()
-            self.set_requires_grad(self.netD, True)
-            self.optimizer_D.zero_grad()
-            self.backward_D(gen_data)
-            self.optimizer_D.step()
+            self.optimize_D()
 
         self.step += 1
 
@@ -180,8 +164,8 @@ class GAGANModel(BaseModel):
                 self.netG.load_state_dict(G_candi)
                 self.optimizer_G.load_state_dict(optG_candi)
                 self.optimizer_G.zero_grad()
-                gen_data = self.forward()
-                G_losses = self.backward_G(gen_data, criterionG)
+                G_losses = self.backward_micro_batches(
+                    lambda weight: self.backward_G(self.forward(), criterionG, weight))
                 self.optimizer_G.step()
 
                 # Evaluation
@@ -253,10 +237,12 @@ class GAGANModel(BaseModel):
         """
         Evaluate netG based on netD
         """
-        with torch.no_grad():
-            eval_data = self.forward()
-        eval_fake = self.netD(eval_data)
-
-        # Quality fitness score
-        Fq = eval_fake.data.mean().item()
+        Fq = 0.
+        for weight, _ in self.micro_batches():
+            with torch.no_grad():
+                eval_data = self.forward()
+            eval_fake = self.netD(eval_data)
+
+            # Quality fitness score
+            Fq += weight * eval_fake.data.mean().item()
         return Fq
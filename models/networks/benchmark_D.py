@@ -0,0 +1,98 @@
+"""Benchmark the fused real+fake discriminator forward (--fuse_D)
+
+It times a D step (forward of the real and the fake batch, loss, backward, optimizer step) and a G step
+(the same passes, with the gradient flowing into the fake batch) with the two separate netD calls
+and with the single fused call of BaseModel.run_D (fused_D_forward), for FCDiscriminator and DCGANDiscriminator.
+For DCGANDiscriminator, it also checks that the fused logits match the separate ones.
+
+Example:
+    python -m models.networks.benchmark_D --device cuda --batch_size 64
+"""
+import copy
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from models.networks.networks import get_norm_layer
+from models.networks.fc import FCDiscriminator
+from models.networks.DCGAN_nets import DCGANDiscriminator
+from models.networks.utils import fused_D_forward
+
+
+def prepare_parser():
+    usage = 'Compare the step time of separate and fused real+fake discriminator calls.'
+    parser = ArgumentParser(description=usage)
+    parser.add_argument('--device', type=str, default='cpu', help='device of the discriminators')
+    parser.add_argument('--batch_size', type=int, default=64, help='size of the real and of the fake batch')
+    parser.add_argument('--fc_dim', type=int, default=300, help='embedding dim of FCDiscriminator')
+    parser.add_argument('--ndf', type=int, default=64, help='# of filters of DCGANDiscriminator')
+    parser.add_argument('--d_norm', type=str, default='batch', help='norm layer of DCGANDiscriminator [batch | none]')
+    parser.add_argument('--steps', type=int, default=50, help='# of timed steps per setting')
+    parser.add_argument('--warmup', type=int, default=5, help='# of untimed steps per setting')
+    return parser
+
+
+def run_D(netD, real, fake, fused):
+    if fused:
+        return fused_D_forward(netD, {'data': real}, {'data': fake})
+    return netD({'data': real}), netD({'data': fake})
+
+
+def step_time(netD, real, fake, fused, G_step, config):
+    """median time of a D step, or of a G step if G_step"""
+    optimizer = torch.optim.Adam(netD.parameters())
+    fake = fake.clone().requires_grad_(G_step)
+    times = []
+    for i in range(config['warmup'] + config['steps']):
+        if real.is_cuda:
+            torch.cuda.synchronize()
+        start_time = time.time()
+        optimizer.zero_grad()
+        real_out, fake_out = run_D(netD, real, fake, fused)
+        loss = fake_out.mean() - real_out.mean()
+        loss.backward()
+        if not G_step:
+            optimizer.step()
+        if real.is_cuda:
+            torch.cuda.synchronize()
+        if i >= config['warmup']:
+            times.append(time.time() - start_time)
+    return sorted(times)[len(times) // 2]
+
+
+def run(config):
+    device = torch.device(config['device'])
+    batch_size = config['batch_size']
+    settings = {
+        'FCDiscriminator': (FCDiscriminator(dim=config['fc_dim']),
+                            torch.randn(batch_size, config['fc_dim']), torch.randn(batch_size, config['fc_dim'])),
+        'DCGANDiscriminator (%s)' % config['d_norm']: (
+            DCGANDiscriminator(config['ndf'], 3, get_norm_layer(config['d_norm'])),
+            torch.randn(batch_size, 3, 32, 32), torch.randn(batch_size, 3, 32, 32)),
+    }
+    for name, (netD, real, fake) in settings.items():
+        netD, real, fake = netD.to(device), real.to(device), fake.to(device)
+        if isinstance(netD, DCGANDiscriminator):
+            fused_netD = copy.deepcopy(netD)
+            with torch.no_grad():
+                expected = torch.cat(run_D(netD, real, fake, False))
+                error = (torch.cat(run_D(fused_netD, real, fake, True)) - expected).abs().max().item()
+            print('%s: max |fused - separate| logit difference %.3e' % (name, error))
+        for step in ['D', 'G']:
+            separate = step_time(netD, real, fake, False, step == 'G', config)
+            fused = step_time(netD, real, fake, True, step == 'G', config)
+            print('%-28s %s step: separate %8.3f ms, fused %8.3f ms, speedup %.2fx'
+                  % (name, step, separate * 1000, fused * 1000, separate / fused))
+
+
+def main():
+    # parse command line
+    parser = prepare_parser()
+    config = vars(parser.parse_args())
+    print(config)
+    run(config)
+
+
+if __name__ == '__main__':
+    main()
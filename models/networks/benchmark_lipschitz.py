@@ -0,0 +1,91 @@
+"""Benchmark the cost of the Lipschitz controls of the discriminator
+
+It times a D step (loss on a real and a fake batch, backward, optimizer step) of FCDiscriminator
+and DCGANDiscriminator without regularization, with the gradient penalty at every step (--use_gp),
+with the lazy gradient penalty / R1 (--gp_every), and with spectral normalization (--spectral_norm_D).
+The effect on the final CSLS / FID is measured by full training runs,
+see scripts/compare_lipschitz_emb.sh and scripts/compare_lipschitz_cifar10.sh.
+
+Example:
+    python -m models.networks.benchmark_lipschitz --device cuda --gp_every 4
+"""
+import time
+from argparse import ArgumentParser
+
+import torch
+
+from models.networks.networks import get_norm_layer, add_spectral_norm
+from models.networks.loss import cal_gradient_penalty
+from models.networks.fc import FCDiscriminator
+from models.networks.DCGAN_nets import DCGANDiscriminator
+
+
+def prepare_parser():
+    usage = 'Compare the D step time of the gradient penalty, lazy gradient penalty and spectral norm.'
+    parser = ArgumentParser(description=usage)
+    parser.add_argument('--device', type=str, default='cpu', help='device of the discriminators')
+    parser.add_argument('--batch_size', type=int, default=64, help='size of the real and of the fake batch')
+    parser.add_argument('--fc_dim', type=int, default=300, help='embedding dim of FCDiscriminator')
+    parser.add_argument('--ndf', type=int, default=64, help='# of filters of DCGANDiscriminator')
+    parser.add_argument('--gp_every', type=int, default=4, help='interval of the lazy gradient penalty')
+    parser.add_argument('--steps', type=int, default=48, help='# of timed steps per setting')
+    parser.add_argument('--warmup', type=int, default=4, help='# of untimed steps per setting')
+    return parser
+
+
+def step_time(netD, real, fake, config, gp_type=None, gp_every=1):
+    """mean time of a D step, over a multiple of gp_every steps"""
+    optimizer = torch.optim.Adam(netD.parameters())
+    total_time = 0.
+    for i in range(config['warmup'] + config['steps']):
+        if real.is_cuda:
+            torch.cuda.synchronize()
+        start_time = time.time()
+        optimizer.zero_grad()
+        loss = netD({'data': fake}).mean() - netD({'data': real}).mean()
+        if gp_type is not None and i % gp_every == 0:
+            penalty_type, constant = ('mixed', 1.0) if gp_type == 'wgangp' else ('real', 0.0)
+            loss = loss + cal_gradient_penalty(netD, real, fake, real.device, type=penalty_type,
+                                               constant=constant, lambda_gp=10.0 * gp_every)[0]
+        loss.backward()
+        optimizer.step()
+        if real.is_cuda:
+            torch.cuda.synchronize()
+        if i >= config['warmup']:
+            total_time += time.time() - start_time
+    return total_time / config['steps']
+
+
+def run(config):
+    device = torch.device(config['device'])
+    batch_size, k = config['batch_size'], config['gp_every']
+    nets = {
+        'FCDiscriminator': (lambda: FCDiscriminator(dim=config['fc_dim']), (config['fc_dim'],)),
+        'DCGANDiscriminator': (lambda: DCGANDiscriminator(config['ndf'], 3, get_norm_layer('none')), (3, 32, 32)),
+    }
+    for name, (make_net, shape) in nets.items():
+        real = torch.randn((batch_size,) + shape, device=device)
+        fake = torch.randn((batch_size,) + shape, device=device)
+        results = {
+            'no regularization': step_time(make_net().to(device), real, fake, config),
+            'wgangp every step': step_time(make_net().to(device), real, fake, config, 'wgangp'),
+            'wgangp every %d steps' % k: step_time(make_net().to(device), real, fake, config, 'wgangp', k),
+            'r1 every %d steps' % k: step_time(make_net().to(device), real, fake, config, 'r1', k),
+            'spectral norm': step_time(add_spectral_norm(make_net().to(device)), real, fake, config),
+        }
+        reference = results['wgangp every step']
+        for setting, seconds in results.items():
+            print('%-20s %-22s %8.3f ms / D step, %.2fx the per-step gradient penalty'
+                  % (name, setting, seconds * 1000, seconds / reference))
+
+
+def main():
+    # parse command line
+    parser = prepare_parser()
+    config = vars(parser.parse_args())
+    print(config)
+    run(config)
+
+
+if __name__ == '__main__':
+    main()
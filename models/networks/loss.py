@@ -152,17 +152,14 @@ def cal_gradient_penalty(netD, real_data, fake_data, device, type='mixed', const
         elif type == 'fake':
             interpolatesv = fake_data
         elif type == 'mixed':
-            alpha = torch.rand(real_data.shape[0], 1)
-            alpha = alpha.expand(real_data.shape[0], real_data.nelement() // real_data.shape[0]).contiguous().view(
-                *real_data.shape)
-            alpha = alpha.to(device)
+            alpha = torch.rand((real_data.shape[0],) + (1,) * (real_data.dim() - 1), device=real_data.device)
             interpolatesv = alpha * real_data + ((1 - alpha) * fake_data)
         else:
             raise NotImplementedError('{} not implemented'.format(type))
-        interpolatesv.requires_grad_(True)
+        interpolatesv = interpolatesv.detach().requires_grad_(True)  # do not flag the real batch itself
         disc_interpolates = netD({'data': interpolatesv})
         gradients = torch.autograd.grad(outputs=disc_interpolates, inputs=interpolatesv,
-                                        grad_outputs=torch.ones(disc_interpolates.size()).to(device),
+                                        grad_outputs=torch.ones_like(disc_interpolates),
                                         create_graph=True, retain_graph=True, only_inputs=True)
         gradients = gradients[0].view(real_data.size(0), -1)  # flat the data
         gradient_penalty = (((gradients + 1e-16).norm(2, dim=1) - constant) ** 2).mean() * lambda_gp  # added eps
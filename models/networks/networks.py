@@ -164,7 +164,23 @@ def define_D(opt, gpu_ids=()):
         net = FCDiscriminator(dim=opt.z_dim)
     else:
         raise NotImplementedError('Discriminator model name [%s] is not recognized' % net)
-    return init_net(net, opt.init_type, opt.init_gain, gpu_ids)
+    net = init_net(net, opt.init_type, opt.init_gain, gpu_ids)
+    if opt.spectral_norm_D:
+        add_spectral_norm(net)
+    return net
+
+
+def add_spectral_norm(net):
+    """Reparameterize the weights of the conv and linear layers of net by their largest singular value
+
+    The power-iteration vectors are buffers (weight_u and weight_v) updated once per training forward,
+    so they stay converged across steps and are saved with the checkpoints.
+    Applied after the initialization, which writes the plain weights.
+    """
+    for module in list(net.modules()):
+        if isinstance(module, (nn.Conv2d, nn.ConvTranspose2d, nn.Linear)):
+            nn.utils.spectral_norm(module)
+    return net
 
 
 ##############################################################################
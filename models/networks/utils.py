@@ -1,9 +1,46 @@
+import functools
+from contextlib import contextmanager
+
 import torch
+from torch import nn
 
 
-def get_prior(bs, z_dim, z_type, device):
+def get_prior(bs, z_dim, z_type, device, generator=None):
     if z_type == 'Gaussian':
-        z = torch.randn(bs, z_dim, 1, 1, device=device)
+        z = torch.randn(bs, z_dim, 1, 1, device=device, generator=generator)
     elif z_type == 'Uniform':
-        z = torch.rand(bs, z_dim, 1, 1, device=device) * 2. - 1.
+        z = torch.rand(bs, z_dim, 1, 1, device=device, generator=generator) * 2. - 1.
     return z
+
+
+def _split_forward(layer, split_sizes, x):
+    return torch.cat([type(layer).forward(layer, part) for part in x.split(split_sizes)])
+
+
+@contextmanager
+def split_batch_norm(net, split_sizes):
+    """Within the context, the batch norm layers of net normalize each part of their input batch
+    (of the given sizes) with its own statistics, and update their running statistics once per part,
+    as if the parts went through net one after another.
+    """
+    if isinstance(net, nn.DataParallel) and len(net.device_ids) > 1:
+        if any(isinstance(module, nn.modules.batchnorm._BatchNorm) for module in net.modules()):
+            raise ValueError('the parts of a batch are scattered across GPUs, '
+                             'batch norm layers cannot normalize them separately')
+    layers = [module for module in net.modules() if isinstance(module, nn.modules.batchnorm._BatchNorm)]
+    for layer in layers:
+        layer.forward = functools.partial(_split_forward, layer, split_sizes)
+    try:
+        yield
+    finally:
+        for layer in layers:
+            del layer.forward
+
+
+def fused_D_forward(netD, real_data, gen_data):
+    """Return the outputs of netD on the real and the fake batch, computed by one netD call
+    on the concatenated 'data' of both batches."""
+    split_sizes = [real_data['data'].shape[0], gen_data['data'].shape[0]]
+    with split_batch_norm(netD, split_sizes):
+        out = netD({'data': torch.cat([real_data['data'], gen_data['data']])})
+    return out.split(split_sizes)
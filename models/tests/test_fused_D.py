@@ -0,0 +1,24 @@
+import copy
+from unittest import TestCase
+
+import torch
+
+from models.networks.DCGAN_nets import DCGANDiscriminator
+from models.networks.networks import get_norm_layer
+from models.networks.utils import fused_D_forward
+
+
+class FusedDTests(TestCase):
+
+    def test_batch_norm_statistics_per_half(self):
+        netD = DCGANDiscriminator(8, 3, get_norm_layer('batch'))
+        fused_netD = copy.deepcopy(netD)
+        real, fake = {'data': torch.randn(4, 3, 32, 32)}, {'data': torch.randn(6, 3, 32, 32) + 1}
+        with torch.no_grad():
+            real_out, fake_out = netD(real), netD(fake)
+            fused_real_out, fused_fake_out = fused_D_forward(fused_netD, real, fake)
+        self.assertTrue(torch.allclose(real_out, fused_real_out, atol=1e-5))
+        self.assertTrue(torch.allclose(fake_out, fused_fake_out, atol=1e-5))
+        for buffer, fused_buffer in zip(netD.buffers(), fused_netD.buffers()):
+            self.assertTrue(torch.allclose(buffer.float(), fused_buffer.float(), atol=1e-6))
+        self.assertNotIn('forward', fused_netD.cnn_model[3].__dict__)  # the batch norm layers are restored
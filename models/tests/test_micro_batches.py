@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+import torch
+
+from models.base_model import BaseModel
+
+
+class MicroBatchTests(TestCase):
+
+    def setUp(self) -> None:
+        inputs = {'data': torch.arange(10.)}
+        self.model = SimpleNamespace(opt=SimpleNamespace(micro_batch_size=4), inputs=inputs, batch_size=10)
+
+    def test_micro_batches(self):
+        fakes = {'data': -torch.arange(10.)}
+        weights, reals = [], []
+        for weight, (fake,) in BaseModel.micro_batches(self.model, fakes):
+            self.assertTrue(torch.equal(fake['data'], -self.model.inputs['data']))
+            self.assertEqual(self.model.batch_size, len(fake['data']))
+            weights.append(weight)
+            reals.append(self.model.inputs['data'])
+        self.assertEqual(weights, [0.4, 0.4, 0.2])
+        self.assertTrue(torch.equal(torch.cat(reals), torch.arange(10.)))
+        self.assertEqual(self.model.batch_size, 10)  # restored
+        self.assertEqual(len(self.model.inputs['data']), 10)
+
+    def test_add_losses(self):
+        total = BaseModel.add_losses(None, {'': torch.tensor(1.), 'mode': 2}, 0.25)
+        total = BaseModel.add_losses(total, {'': torch.tensor(3.), 'mode': 2}, 0.75)
+        self.assertAlmostEqual(float(total['']), 2.5)
+        self.assertEqual(total['mode'], 2)
@@ -2,7 +2,7 @@ import torch
 
 from .base_model import BaseModel
 from models.networks import networks
-from models.networks.loss import GANLoss, cal_gradient_penalty
+from models.networks.loss import GANLoss
 from models.networks.utils import get_prior
 from util.util import one_hot
 from .optimizers import get_optimizer
@@ -46,9 +46,9 @@ class TwoPlayerGANModel(BaseModel):
             self.optimizers.append(self.optimizer_D)
 
     def forward(self) -> dict:
-        batch_size = self.opt.batch_size
+        batch_size = self.batch_size
         if self.opt.gan_mode == "conditional":
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             y = self.CatDis.sample([batch_size])
             y = one_hot(y, [batch_size, self.opt.cat_num])
             gen_data = self.netG(z, y)
@@ -59,7 +59,7 @@ class TwoPlayerGANModel(BaseModel):
             self.set_output(gen_data)
             return {'data': gen_data}
         elif self.opt.gan_mode == 'unconditional-z':
-            z = get_prior(self.opt.batch_size, self.opt.z_dim, self.opt.z_type, self.device)
+            z = get_prior(batch_size, self.opt.z_dim, self.opt.z_type, self.device)
             gen_data = self.netG({'data': z})
             self.set_output(gen_data)
             return {'data': gen_data}
@@ -72,49 +72,34 @@ class TwoPlayerGANModel(BaseModel):
     def get_output(self):
         return self.output
 
-    def backward_G(self, gen_data):
+    def backward_G(self, gen_data, weight=1.):
         # pass D
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
         self.loss_G_fake, self.loss_G_real = self.criterionG(fake_out, real_out)
         self.loss_G = self.loss_G_fake + self.loss_G_real
-        self.loss_G.backward()
+        (weight * self.loss_G).backward()
 
-    def backward_D(self, gen_data):
+    def backward_D(self, gen_data, weight=1.):
+        gen_data = self.fake_pool.query(gen_data)
         # pass D
-        real_out = self.netD(self.inputs)
-        fake_out = self.netD(gen_data)
+        real_out, fake_out = self.run_D(self.inputs, gen_data)
 
         self.loss_D_fake, self.loss_D_real = self.criterionD(fake_out, real_out)
-        if self.opt.use_gp is True:
-            self.loss_D_gp = cal_gradient_penalty(
-                self.netD,
-                self.inputs['data'],
-                gen_data['data'],
-                self.device,
-                type='mixed',
-                constant=1.0,
-                lambda_gp=10.0,
-            )[0]
-        else:
-            self.loss_D_gp = 0.
+        self.loss_D_gp = self.gradient_penalty(self.inputs['data'], gen_data['data'])
 
         self.loss_D = self.loss_D_fake + self.loss_D_real + self.loss_D_gp
-        self.loss_D.backward()
+        (weight * self.loss_D).backward()
 
     def optimize_parameters(self):
-        gen_data = self.forward()
         if self.step % (self.opt.D_iters + 1) == 0:
             self.set_requires_grad(self.netD, False)
             self.optimizer_G.zero_grad()
-            self.backward_G(gen_data)
+            self.backward_micro_batches(lambda weight: self.backward_G(self.forward(), weight),
+                                        loss_names=['G_fake', 'G_real', 'G'])
             self.optimizer_G.step()
             if self.opt.dataset_mode == 'embedding' and not self.opt.exact_orthogonal:
                 self.orthogonalize(self.netG)
         else:
-            self.set_requires_grad(self.netD, True)
-            self.optimizer_D.zero_grad()
-            self.backward_D(gen_data)
-            self.optimizer_D.step()
+            self.optimize_D()
 
         self.step += 1
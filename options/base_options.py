@@ -39,6 +39,7 @@ class BaseOptions():
         parser.add_argument('--n_layers_D', type=int, default=3, help='only used if netD==n_layers')
         parser.add_argument('--g_norm', type=str, default='none', help='instance normalization or batch normalization [instance | batch | none]')
         parser.add_argument('--d_norm', type=str, default='batch', help='instance normalization or batch normalization [instance | batch | none]')
+        parser.add_argument('--spectral_norm_D', action='store_true', help='if specified, use spectral normalization in the conv and linear layers of D')
         parser.add_argument('--init_type', type=str, default='normal', help='network initialization [normal | xavier | kaiming | orthogonal]')
         parser.add_argument('--init_gain', type=float, default=0.02, help='scaling factor for normal, xavier and orthogonal.')
         parser.add_argument('--no_dropout', action='store_true', help='no dropout for the generator')
@@ -46,6 +47,8 @@ class BaseOptions():
         parser.add_argument('--dataset_mode', type=str, default='embedding', help='chooses how datasets are loaded. [unaligned | aligned | single | colorization]')
         parser.add_argument('--serial_batches', action='store_true', help='if true, takes images in order to make batches, otherwise takes them randomly')
         parser.add_argument('--num_threads', default=4, type=int, help='# threads for loading data')
+        parser.add_argument('--data_stream', action='store_true', help='if specified, load data as one endless stream with persistent workers and stage the next batch on the GPU during each step')
+        parser.add_argument('--prefetch_depth', default=2, type=int, help='# batches loaded ahead by each data worker with --data_stream')
         parser.add_argument('--batch_size', type=int, default=1, help='input batch size')
         parser.add_argument('--load_size', type=int, default=256, help='scale images to this size')
         parser.add_argument('--crop_size', type=int, default=256, help='then crop to this size')
@@ -60,11 +63,31 @@ class BaseOptions():
         parser.add_argument('--suffix', default='', type=str, help='customized suffix: opt.name = opt.name + suffix: e.g., {model}_{netG}_size{load_size}')
         parser.add_argument('--wandb', action='store_true', help='if specified, log results to wandb')
         # score measurement
-        parser.add_argument('--score_name', nargs='*', help='selected socres for evultaion, FID, IS', default=['FID','IS'])
-        parser.add_argument('--evaluation_size', default=50000, type=int, help='# of total sample size for socre evaluation')
+        parser.add_argument('--score_name', nargs='*', help='selected socres for evultaion, FID, IS, KID', default=['FID','IS'])
+        parser.add_argument('--evaluation_size', default=5000, type=int, help='# of total sample size for socre evaluation, 50000 for the reference IS / FID')
+        parser.add_argument('--adaptive_eval_tolerance', default=0, type=float, help='stop a streamed FID (IS without FID) evaluation once its 95%% confidence half-width is below this, 0 to always use evaluation_size')
+        parser.add_argument('--adaptive_eval_stages', nargs='*', type=int, default=[5000, 10000, 20000], help='sample counts at which an adaptive evaluation checks its confidence interval, evaluation_size is the last stage')
 
         parser.add_argument('--fid_stat_file', default='./TTUR/stats/fid_stats_cifar10_train.npz', help='path to fid stats')
         parser.add_argument('--fid_batch_size', default=100, type=int, help='# fid calculate batch size')
+        parser.add_argument('--kid_size', default=2000, type=int, help='# generated and real samples for KID, real features are computed once per run')
+        parser.add_argument('--kid_subsets', default=10, type=int, help='# disjoint subsets for the KID std')
+        parser.add_argument('--stats_cache_dir', default='', type=str, help='directory caching inception statistics of seeded generator samples, keyed by a hash of the weights; empty for no cache')
+        parser.add_argument('--stats_cache_size', default=2048, type=int, help='size bound (MB) of the statistics cache, least recently used entries are evicted')
+        parser.add_argument('--eval_seed', default=0, type=int, help='seed of the private noise generator of the evaluation samples')
+        parser.add_argument('--knn_tile_size', default=4096, type=int, help='tile size of the k-NN similarity sweep for CSLS')
+        parser.add_argument('--knn_max_memory', default=0, type=int, help='memory budget (MB) of one k-NN similarity tile, 0 for no limit')
+        parser.add_argument('--eval_num_threads', default=0, type=int, help='# threads for CPU matmul during evaluation, 0 for torch default; ignored with --async_eval')
+        parser.add_argument('--ann_n_lists', default=0, type=int, help='# inverted lists of the approximate nearest-neighbour index for embedding evaluation, 0 for exact search')
+        parser.add_argument('--ann_n_probe', default=16, type=int, help='# inverted lists visited per query')
+        parser.add_argument('--ann_pq_m', default=0, type=int, help='# product quantization sub-vectors, 0 to store the full vectors')
+        parser.add_argument('--ann_rerank', default=0, type=int, help='shortlist size re-scored exactly with product quantization')
+        parser.add_argument('--ann_csls_shortlist', default=100, type=int, help='# nearest neighbors of each query retrieved from the index and re-ranked by CSLS')
+        parser.add_argument('--ann_report_recall', action='store_true', help='if specified, report recall@k of the index against exact search')
+        parser.add_argument('--eval_precision', default='fp32', choices=['fp32', 'bf16'], help='precision of the coarse similarity sweep of embedding evaluation, shortlists are re-scored in fp32')
+        parser.add_argument('--eval_shortlist', default=4096, type=int, help='# retrieval candidates per query re-scored exactly after a low precision sweep')
+        parser.add_argument('--eval_knn_shortlist', default=32, type=int, help='# k-NN candidates per word re-scored exactly for the CSLS statistics after a low precision sweep')
+        parser.add_argument('--eval_compare_exact', action='store_true', help='if specified, also run the fp32 path and report P@k deviation and speedup; not with --ann_n_lists')
         self.initialized = True
         return parser
 
@@ -0,0 +1,15 @@
+from .train_options import TrainOptions
+
+
+class SweepOptions(TrainOptions):
+    """This class includes the options of the checkpoint evaluation sweep.
+
+    It also includes the training options, which describe the swept model and its scores.
+    """
+
+    def initialize(self, parser):
+        parser = TrainOptions.initialize(self, parser)
+        parser.add_argument('--sweep_dir', type=str, default='', help='directory of the swept <epoch>_net_G.pth checkpoints; empty for checkpoints_dir/name')
+        parser.add_argument('--sweep_prefetch', type=int, default=8, help='# sample batches generated ahead of the inception net')
+        parser.add_argument('--sweep_results', type=str, default='sweep_scores.csv', help='metrics table written to the sweep directory')
+        return parser
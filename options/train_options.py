@@ -13,6 +13,9 @@ class TrainOptions(BaseOptions):
         parser.add_argument('--display_freq', type=int, default=400, help='frequency of showing training results on screen')
         parser.add_argument('--print_freq', type=int, default=100, help='frequency of showing training results on console')
         parser.add_argument('--score_freq', type=int, default=100, help='frequency of calculating scores')
+        parser.add_argument('--async_eval', action='store_true', help='if specified, evaluate snapshots of netG in a background thread')
+        parser.add_argument('--eval_queue_size', type=int, default=1, help='# pending snapshots of async evaluation, older ones are dropped')
+        parser.add_argument('--eval_device', type=str, default='', help='device of async evaluation, e.g. cuda:1 or cpu; empty for the training device')
         # network saving and loading parameters
         parser.add_argument('--save_latest_freq', type=int, default=5000, help='frequency of saving the latest results')
         parser.add_argument('--save_giters_freq', type=int, default=10000, help='frequency of saving checkpoints at the end of epochs')
@@ -28,11 +31,20 @@ class TrainOptions(BaseOptions):
         parser.add_argument('--optim_type', type=str)
         parser.add_argument('--lr_g', type=float, default=0.0002, help='initial learning rate for adam')
         parser.add_argument('--lr_d', type=float, default=0.0002, help='initial learning rate for adam')
-        parser.add_argument('--pool_size', type=int, default=50, help='the size of image buffer that stores previously generated images')
+        parser.add_argument('--pool_size', type=int, default=0, help='the size of image buffer that stores previously generated images fed to D, 0 for no buffer')
+        parser.add_argument('--fuse_D', action='store_true', help='if specified, real and fake batches go through D in one call (batch norm statistics stay per batch)')
+        parser.add_argument('--micro_batch_size', type=int, default=0, help='if > 0, split each step into micro-batches of this size and accumulate their gradients, so that memory is bounded by the micro-batch')
+        parser.add_argument('--reuse_fakes', action='store_true', help='if specified, the D steps between two G steps share one fake batch')
         parser.add_argument('--lr_policy', type=str, default='linear', help='learning rate policy. [linear | step | plateau | cosine]')
         parser.add_argument('--lr_decay_iters', type=int, default=50, help='multiply by a gamma every lr_decay_iters iterations')
 
         parser.add_argument('--use_gp', action='store_true', default=False, help='if usei gradients penalty')
+        parser.add_argument('--gp_type', type=str, default='wgangp', help='gradient penalty: on real-fake interpolates toward norm 1 (wgangp) or on reals toward 0 (r1) [wgangp | r1]')
+        parser.add_argument('--gp_every', type=int, default=1, help='apply the gradient penalty every gp_every D steps, with its weight multiplied by gp_every')
         parser.add_argument('--use_pytorch_scores', action='store_true', default=False, help='if use pytorch version scores')
+        parser.add_argument('--inception_device', type=str, default='', help='device of the pytorch inception net, e.g. cpu; empty for the training device')
+        parser.add_argument('--inception_channels_last', action='store_true', help='if specified, run the pytorch inception net in channels_last memory format')
+        parser.add_argument('--inception_bf16', action='store_true', help='if specified, autocast the pytorch inception net to bf16')
+        parser.add_argument('--inception_num_threads', type=int, default=0, help='# CPU threads of the pytorch inception net, 0 for torch default; ignored with --async_eval')
         self.isTrain = True
         return parser
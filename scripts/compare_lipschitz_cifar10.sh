@@ -0,0 +1,27 @@
+gp_every=${1:-4}
+
+# train the wgan DCGAN on CIFAR-10 with each Lipschitz control of D, then compare the FID
+# and the step times logged under ./checkpoints/wgan_cifar10_*
+set -ex
+for variant in "gp --use_gp" \
+               "lazy_gp --use_gp --gp_every $gp_every" \
+               "lazy_r1 --use_gp --gp_type r1 --gp_every $gp_every" \
+               "sn --spectral_norm_D"; do
+    set -- $variant
+    name=$1
+    shift
+    python train.py --name wgan_cifar10_$name \
+           --dataset_mode cifar_tensor --batch_size 32 --dataroot None \
+           --model two_player_gan --gan_mode unconditional-z \
+           --gpu_ids 0 \
+           --download_root ./datasets/cifar10 --dataset_name CIFAR10 \
+           --crop_size 32 --load_size 32 \
+           --optim_type Adam \
+           --d_loss_mode wgan --g_loss_mode wgan --which_D S "$@" \
+           --netD DCGAN --netG DCGAN --ngf 128 --ndf 128 --g_norm none --d_norm none \
+           --init_type normal --init_gain 0.02 \
+           --no_dropout --no_flip \
+           --D_iters 1 \
+           --use_pytorch_scores --score_name FID --evaluation_size 5000 --fid_batch_size 500 \
+           --print_freq 2000 --display_freq 2000 --score_freq 5000 --save_giters_freq 100000
+done
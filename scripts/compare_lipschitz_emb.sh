@@ -0,0 +1,30 @@
+source_dataset_name=$1
+target_dataset_name=$2
+gp_every=${3:-4}
+
+# train the wgan embedding mapping with each Lipschitz control of D, then compare the muse-csls-en
+# scores and the step times logged under ./checkpoints/wgan_emb_*
+set -ex
+for variant in "gp --use_gp" \
+               "lazy_gp --use_gp --gp_every $gp_every" \
+               "lazy_r1 --use_gp --gp_type r1 --gp_every $gp_every" \
+               "sn --spectral_norm_D"; do
+    set -- $variant
+    name=$1
+    shift
+    python train.py --name wgan_emb_$name \
+           --dataset_mode embedding --batch_size 32 --dataroot None \
+           --max_dataset_size 200000 --preprocess center \
+           --source_dataset_name $source_dataset_name --target_dataset_name $target_dataset_name \
+           --model two_player_gan --gan_mode unconditional \
+           --gpu_ids 0 \
+           --d_loss_mode wgan --g_loss_mode wgan --which_D S "$@" \
+           --optim_type Adam --lr_g 0.001 --lr_d 0.001 \
+           --netD fc --z_dim 10 --netG fc --ngf 128 --ndf 128 --g_norm none --d_norm none \
+           --init_type diagonal --init_gain 0.02 \
+           --no_dropout --no_flip \
+           --D_iters 1 \
+           --score_name muse-csls-en \
+           --print_freq 2000 --display_freq 2000 --score_freq 10000 \
+           --save_latest_freq 100000 --save_giters_freq 100000 --most_frequent 75000
+done
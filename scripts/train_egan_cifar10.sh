@@ -1,6 +1,6 @@
 set -ex
 python train.py --name egan_cifar10 \
-       --dataset_mode torchvision --batch_size 32 --eval_size 256 --dataroot None \
+       --dataset_mode cifar_tensor --batch_size 32 --eval_size 256 --dataroot None \
        --model egan \
        --gpu_ids 0 \
        --download_root ./datasets/cifar10 --dataset_name CIFAR10 \
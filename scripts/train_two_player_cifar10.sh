@@ -1,6 +1,6 @@
 set -ex
 python train.py --name lsgan_cifar10 \
-       --dataset_mode torchvision --batch_size 32 --dataroot None \
+       --dataset_mode cifar_tensor --batch_size 32 --dataroot None \
        --model two_player_gan --gan_mode unconditional-z \
        --gpu_ids 0 \
        --download_root ./datasets/cifar10 --dataset_name CIFAR10 \
@@ -11,5 +11,5 @@ python train.py --name lsgan_cifar10 \
        --init_type normal --init_gain 0.02 \
        --no_dropout --no_flip \
        --D_iters 1 \
-       --use_pytorch_scores --score_name IS --fid_batch_size 500 \
-       --print_freq 2000 --display_freq 2000 --score_freq 500 --save_giters_freq 100000
+       --use_pytorch_scores --score_name IS --evaluation_size 5000 --fid_batch_size 500 \
+       --print_freq 2000 --display_freq 2000 --score_freq 5000 --save_giters_freq 100000
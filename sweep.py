@@ -0,0 +1,120 @@
+"""Checkpoint evaluation sweep.
+
+It scores every '<epoch>_net_G.pth' checkpoint that BaseModel.save_networks wrote for a run,
+with one evaluator, i.e. the Inception network and reference statistics are loaded once.
+A background thread loads the next checkpoint into a replica of netG and generates its samples
+while the Inception network is still scoring the current one.
+The scores of all checkpoints are printed and written as a table to --sweep_results.
+
+Example:
+    python sweep.py --name egan_cifar10 --dataset_mode torchvision --model egan --gan_mode unconditional-z \
+           --netG DCGAN --ngf 128 --z_dim 100 --z_type Uniform --use_pytorch_scores --score_name FID IS
+
+See options/sweep_options.py and options/train_options.py for more sweep options.
+"""
+import copy
+import csv
+import glob
+import json
+import os
+import queue
+import re
+import threading
+
+import torch
+
+from options.sweep_options import SweepOptions
+from data import create_dataset
+from models import create_model
+from models.networks.utils import get_prior
+from evaluators import get_evaluator
+
+
+def find_checkpoints(sweep_dir):
+    """return the '<epoch>_net_G.pth' labels in sweep_dir, ordered by their iteration (latest last)"""
+    labels = [os.path.basename(path)[:-len('_net_G.pth')] for path in glob.glob(os.path.join(sweep_dir, '*_net_G.pth'))]
+
+    def order(label):
+        numbers = re.findall(r'\d+', label)
+        return (int(numbers[-1]) if numbers else float('inf'), label)
+    return sorted(labels, key=order)
+
+
+def produce_samples(opt, netG, sweep_dir, labels, batches, get_cache_key=None):
+    """load each checkpoint into netG and put its stats cache key (None without get_cache_key),
+    its evaluation batches, then None in the queue;
+    an error is put in the queue instead, for the consumer to raise it"""
+    try:
+        device = next(netG.parameters()).device
+        stream = torch.cuda.Stream(device) if device.type == 'cuda' else None
+        with torch.no_grad(), torch.cuda.stream(stream):  # no-op without a stream
+            for label in labels:
+                state_dict = torch.load(os.path.join(sweep_dir, '%s_net_G.pth' % label), map_location=str(device))
+                (netG.module if isinstance(netG, torch.nn.DataParallel) else netG).load_state_dict(state_dict)
+                batches.put(get_cache_key(netG) if get_cache_key is not None else None)
+                generator = torch.Generator(device).manual_seed(opt.eval_seed)
+                for _ in range(0, opt.evaluation_size, opt.fid_batch_size):
+                    z = get_prior(opt.fid_batch_size, opt.z_dim, opt.z_type, device, generator)
+                    samples = netG({'data': z})
+                    if stream is not None:
+                        stream.synchronize()  # the consumer reads the batch on another stream
+                    batches.put(samples)
+                batches.put(None)
+    except Exception as e:
+        batches.put(e)
+
+
+def get_batch(batches):
+    """return the next item of the producer, raising its error if it failed"""
+    batch = batches.get()
+    if isinstance(batch, Exception):
+        raise RuntimeError('the sample producer failed') from batch
+    return batch
+
+
+if __name__ == '__main__':
+    opt = SweepOptions().parse()  # get sweep options
+    if opt.gan_mode != 'unconditional-z':
+        raise ValueError('the sweep samples netG from the prior, it needs --gan_mode unconditional-z')
+    model = create_model(opt)  # create a model given opt.model and other options
+    model.setup(opt)  # regular setup: load and print networks; create schedulers
+    model.eval()
+    dataset = create_dataset(opt)  # create a dataset given opt.dataset_mode and other options
+    evaluator = get_evaluator(opt, model=model, dataset=dataset)  # loads the inception net once
+
+    sweep_dir = opt.sweep_dir or os.path.join(opt.checkpoints_dir, opt.name)
+    labels = find_checkpoints(sweep_dir)
+    print('The number of checkpoints = %d' % len(labels))
+
+    batches = queue.Queue(maxsize=opt.sweep_prefetch)
+    # the replica samples like the evaluator does (eval mode, private --eval_seed generator),
+    # so that the scores match the ones cached during training
+    netG = copy.deepcopy(model.netG).eval()
+    # the replica's weights key the cached statistics (--stats_cache_dir), so checkpoints are loaded only once
+    get_cache_key = evaluator.get_cache_key if opt.stats_cache_dir else None
+    producer = threading.Thread(target=produce_samples, args=(opt, netG, sweep_dir, labels, batches, get_cache_key),
+                                daemon=True)
+    producer.start()
+    evaluator.sample = lambda: get_batch(batches)  # stream the producer's batches instead of sampling model.netG
+
+    rows = []
+    for label in labels:
+        cache_key = get_batch(batches)
+        evaluator.get_cache_key = lambda netG: cache_key
+        scores = evaluator.get_current_scores()
+        while get_batch(batches) is not None:  # skip the batches left over by early-stopped or cached evaluations
+            pass
+        print('checkpoint: ', label, end='')
+        print(json.dumps(scores, indent=4))
+        rows.append({'checkpoint': label, **scores})
+    producer.join()
+
+    results_path = os.path.join(sweep_dir, opt.sweep_results)
+    with open(results_path, 'w', newline='') as f:
+        fieldnames = ['checkpoint']  # the union of the score keys, in order of appearance
+        for row in rows:
+            fieldnames += [key for key in row if key not in fieldnames]
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    print('scores of %d checkpoints written to %s' % (len(rows), results_path))
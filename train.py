@@ -21,6 +21,15 @@ from options.train_options import TrainOptions
 from data import create_dataset
 from models import create_model
 from evaluators import get_evaluator
+from evaluators.async_evaluator import AsyncEvaluator
+
+
+def log_scores(opt, iters, scores, step):
+    """print and log the scores of the generator at <iters>, wandb only accepts increasing <step>s"""
+    print('iters: ', iters, end='')
+    print(json.dumps(scores, indent=4))
+    if opt.wandb:
+        wandb.log({**scores, 'score_iters': iters}, step=step)
 
 
 if __name__ == '__main__':
@@ -30,7 +39,10 @@ if __name__ == '__main__':
     dataset = create_dataset(opt)  # create a dataset given opt.dataset_mode and other options
     dataset_size = len(dataset)  # get the number of images in the dataset.
     print('The number of training samples = %d' % dataset_size)
-    evaluator = get_evaluator(opt, model=model, dataset=dataset)
+    if opt.async_eval:  # evaluate generator snapshots in the background
+        evaluator = AsyncEvaluator(opt, model=model, dataset=dataset)
+    else:
+        evaluator = get_evaluator(opt, model=model, dataset=dataset)
     total_iters = 0  # the total number of training iterations
     epoch = 0
 
@@ -46,18 +58,18 @@ if __name__ == '__main__':
         for i, data in enumerate(dataset):  # inner loop within one epoch
             iter_start_time = time.time()  # timer for computation per iteration
 
-            if total_iters % opt.print_freq == 0:
-                t_data = iter_start_time - iter_data_time
+            t_data = iter_start_time - iter_data_time  # time spent waiting for this batch
 
             model.set_input(data)  # unpack data from dataset and apply preprocessing
             model.optimize_parameters()  # calculate loss functions, get gradients, update network weights
+            t_comp = time.time() - iter_start_time
 
             epoch_iter += 1
             total_iters += 1
 
-            if total_iters % opt.display_freq == 0 and opt.dataset_mode == 'torchvision':
+            if total_iters % opt.display_freq == 0 and opt.dataset_mode in ['torchvision', 'cifar_tensor']:
                 samples = model.get_output()
-                if opt.wandb and opt.dataset_mode=="torchvision":
+                if opt.wandb:
                     wandb.log(
                         {
                             "fake-samples": [wandb.Image((im + 1) / 2) for im in samples],
@@ -68,17 +80,20 @@ if __name__ == '__main__':
 
             if total_iters % opt.print_freq == 0:  # print training losses and save logging information to the disk
                 losses = model.get_current_losses()
+                losses.update({'t_data': t_data, 't_comp': t_comp})
                 print('iters: ', total_iters, end='')
                 print(json.dumps(losses, indent=4))
                 if opt.wandb:
                     wandb.log(losses, step=total_iters)
 
             if total_iters % opt.score_freq == 0:  # print generation scores and save logging information to the disk
-                scores = evaluator.get_current_scores()
-                print('iters: ', total_iters, end='')
-                print(json.dumps(scores, indent=4))
-                if opt.wandb:
-                    wandb.log(scores, step=total_iters)
+                if opt.async_eval:
+                    evaluator.submit(total_iters)
+                else:
+                    log_scores(opt, total_iters, evaluator.get_current_scores(), total_iters)
+            if opt.async_eval:
+                for score_iters, scores in evaluator.poll():
+                    log_scores(opt, score_iters, scores, total_iters)
 
             if total_iters % opt.save_latest_freq == 0:  # cache our latest model every <save_latest_freq> iterations
                 print('saving the latest model (epoch %d, iters %d)' % (epoch, total_iters))
@@ -95,3 +110,7 @@ if __name__ == '__main__':
         epoch += 1
         print('(epoch_%d) End of giters %d / %d \t Time Taken: %d sec \t %d sample / s' % (
         epoch, total_iters, opt.total_num_giters, time.time() - epoch_start_time, len(dataset) // (time.time() - epoch_start_time)))
+
+    if opt.async_eval:
+        for score_iters, scores in evaluator.close():
+            log_scores(opt, score_iters, scores, total_iters)
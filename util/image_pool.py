@@ -1,4 +1,3 @@
-import random
 import torch
 
 
@@ -7,6 +6,8 @@ class ImagePool():
 
     This buffer enables us to update discriminators using a history of generated images
     rather than the ones produced by the latest generators.
+    The buffer is preallocated on the device of the first queried batch and a whole batch is
+    processed with a few tensor ops, instead of one torch.cat per image.
     """
 
     def __init__(self, pool_size):
@@ -18,37 +19,52 @@ class ImagePool():
         self.pool_size = pool_size
         if self.pool_size > 0:  # create an empty pool
             self.num_imgs = 0
-            self.images = []
+            self.buffers = None  # allocated at the first query, once the shapes are known
 
     def query(self, images):
         """Return an image from the pool.
 
         Parameters:
-            images: the latest generated images from the generator
+            images: the latest generated images from the generator, a tensor or a dict of tensors
+                    (e.g. {'data': images, 'condition': labels}) whose rows are pooled together
 
-        Returns images from the buffer.
+        Returns images from the buffer, with the type of images.
 
-        By 50/100, the buffer will return input images.
+        While the buffer is not full, the images are inserted into it and returned.
+        Once it is full, by 50/100, the buffer will return input images.
         By 50/100, the buffer will return images previously stored in the buffer,
         and insert the current images to the buffer.
         """
         if self.pool_size == 0:  # if the buffer size is 0, do nothing
             return images
-        return_images = []
-        for image in images:
-            image = torch.unsqueeze(image.data, 0)
-            if self.num_imgs < self.pool_size:   # if the buffer is not full; keep inserting current images to the buffer
-                self.num_imgs = self.num_imgs + 1
-                self.images.append(image)
-                return_images.append(image)
-            else:
-                p = random.uniform(0, 1)
-                if p > 0.5:  # by 50% chance, the buffer will return a previously stored image, and insert the current image into the buffer
-                    random_id = random.randint(0, self.pool_size - 1)  # randint is inclusive
-                    tmp = self.images[random_id].clone()
-                    self.images[random_id] = image
-                    return_images.append(tmp)
-                else:       # by another 50% chance, the buffer will return the current image
-                    return_images.append(image)
-        return_images = torch.cat(return_images, 0)   # collect all the images and return
-        return return_images
+        if isinstance(images, dict):
+            keys = list(images)
+            return dict(zip(keys, self._query([images[key] for key in keys])))
+        return self._query([images])[0]
+
+    def _query(self, tensors):
+        tensors = [tensor.detach() for tensor in tensors]
+        if self.buffers is None:
+            self.buffers = [tensor.new_empty((self.pool_size,) + tensor.shape[1:]) for tensor in tensors]
+        batch_size = tensors[0].shape[0]
+        device = tensors[0].device
+
+        # if the buffer is not full; keep inserting current images to the buffer
+        num_inserted = min(batch_size, self.pool_size - self.num_imgs)
+        for buffer, tensor in zip(self.buffers, tensors):
+            buffer[self.num_imgs:self.num_imgs + num_inserted] = tensor[:num_inserted]
+        self.num_imgs += num_inserted
+
+        # by 50% chance, an image is swapped with a stored one; distinct slots, so that a swap never sees another
+        swapped = (torch.rand(batch_size, device=device) > 0.5).nonzero().view(-1)
+        swapped = swapped[swapped >= num_inserted][:self.pool_size]
+        if len(swapped) == 0:
+            return tensors
+        slots = torch.randperm(self.pool_size, device=device)[:len(swapped)]
+        return_tensors = []
+        for buffer, tensor in zip(self.buffers, tensors):
+            return_tensor = tensor.clone()
+            return_tensor[swapped] = buffer[slots]
+            buffer[slots] = tensor[swapped]
+            return_tensors.append(return_tensor)
+        return return_tensors
@@ -11,12 +11,19 @@ from six.moves import urllib
 import tensorflow.compat.v1 as tf
 
 tf.disable_v2_behavior()
-import math
+import queue
 import sys
+import threading
+
+import torch
+
+from evaluators.inception_pytorch.inception_utils import RunningInceptionScore
 
 MODEL_DIR = '/tmp/imagenet'
 DATA_URL = 'http://download.tensorflow.org/models/image/imagenet/inception-2015-12-05.tgz'
 softmax = None
+images_placeholder = None
+session = None
 
 
 def get_tf_config():
@@ -25,37 +32,61 @@ def get_tf_config():
     return config
 
 
+# The session is created once and reused by every call.
+def get_session():
+    global session
+    if session is None:
+        session = tf.Session(config=get_tf_config())
+    return session
+
+
+# Convert images to float32 batches in a background thread, <prefetch> batches
+# ahead of the session.
+def _prefetch_batches(images, batch_size, prefetch):
+    batches = queue.Queue(maxsize=prefetch)
+
+    def produce():
+        try:
+            for i in range(0, len(images), batch_size):
+                batches.put(np.stack(images[i:i + batch_size]).astype(np.float32))
+            batches.put(None)
+        except Exception as e:  # e.g. images of different shapes, raised by the consumer
+            batches.put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        batch = batches.get()
+        if batch is None:
+            return
+        if isinstance(batch, Exception):
+            raise RuntimeError('the batch producer failed') from batch
+        yield batch
+
+
+# Feed an iterable of NHWC float batches (values from 0 to 255) to the net and
+# fold the softmax outputs into running split statistics, the same ones the
+# PyTorch inception metrics use. Returns the RunningInceptionScore.
+def accumulate_inception_score(batches, num_images, splits=10):
+    sess = get_session()
+    inception_score = RunningInceptionScore(num_images, splits, softmax.get_shape()[-1].value, keep_leftovers=True)
+    for batch in batches:
+        sys.stdout.write(".")
+        sys.stdout.flush()
+        pred = sess.run(softmax, {images_placeholder: batch})
+        inception_score.update(torch.from_numpy(pred))
+    return inception_score
+
+
 # Call this function with list of images. Each of elements should be a
 # numpy array with values ranging from 0 to 255.
-def get_inception_score(images, splits=10):
-    assert (type(images) == list)
+def get_inception_score(images, splits=10, batch_size=100, prefetch=4):
+    assert (type(images) == list or type(images) == np.ndarray)
     assert (type(images[0]) == np.ndarray)
     assert (len(images[0].shape) == 3)
     assert (np.max(images[0]) > 10)
     assert (np.min(images[0]) >= 0.0)
-    inps = []
-    for img in images:
-        img = img.astype(np.float32)
-        inps.append(np.expand_dims(img, 0))
-    bs = 1
-    with tf.Session(config=get_tf_config()) as sess:
-        preds = []
-        n_batches = int(math.ceil(float(len(inps)) / float(bs)))
-        for i in range(n_batches):
-            sys.stdout.write(".")
-            sys.stdout.flush()
-            inp = inps[(i * bs):min((i + 1) * bs, len(inps))]
-            inp = np.concatenate(inp, 0)
-            pred = sess.run(softmax, {'ExpandDims:0': inp})
-            preds.append(pred)
-        preds = np.concatenate(preds, 0)
-        scores = []
-        for i in range(splits):
-            part = preds[(i * preds.shape[0] // splits):((i + 1) * preds.shape[0] // splits), :]
-            kl = part * (np.log(part) - np.log(np.expand_dims(np.mean(part, 0), 0)))
-            kl = np.mean(np.sum(kl, 1))
-            scores.append(np.exp(kl))
-        return np.mean(scores), np.std(scores)
+    batches = _prefetch_batches(images, batch_size, prefetch)
+    return accumulate_inception_score(batches, len(images), splits).compute()
 
 
 # This function is called automatically.
@@ -80,27 +111,17 @@ def _init_inception():
             MODEL_DIR, 'classify_image_graph_def.pb'), 'rb') as f:
         graph_def = tf.GraphDef()
         graph_def.ParseFromString(f.read())
-        _ = tf.import_graph_def(graph_def, name='')
-    # Works with an arbitrary minibatch size.
-    with tf.Session(config=get_tf_config()) as sess:
-        pool3 = sess.graph.get_tensor_by_name('pool_3:0')
-        ops = pool3.graph.get_operations()
-        for op_idx, op in enumerate(ops):
-            for o in op.outputs:
-                shape = o.get_shape()
-                shape = [s.value for s in shape]
-                new_shape = []
-                for j, s in enumerate(shape):
-                    if s == 1 and j == 0:
-                        new_shape.append(None)
-                    else:
-                        new_shape.append(s)
-                # o._shape = tf.TensorShape(new_shape)
-                o.set_shape(tf.TensorShape(new_shape))
-        w = sess.graph.get_operation_by_name("softmax/logits/MatMul").inputs[1]
-        logits = tf.matmul(tf.squeeze(pool3, [1, 2]), w)
-        softmax = tf.nn.softmax(logits)
-
+    # Works with an arbitrary minibatch size: the graph fixes the batch dimension
+    # of its input to 1, which set_shape cannot relax, so the input is replaced by
+    # a placeholder and the shapes of the whole net are inferred again from it.
+    global images_placeholder
+    images_placeholder = tf.placeholder(tf.float32, [None, None, None, 3], name='inception_images')
+    pool3, matmul = tf.import_graph_def(
+        graph_def, input_map={'ExpandDims:0': images_placeholder},
+        return_elements=['pool_3:0', 'softmax/logits/MatMul'], name='')
+    w = matmul.inputs[1]
+    logits = tf.matmul(tf.squeeze(pool3, [1, 2]), w)
+    softmax = tf.nn.softmax(logits)
 
 if softmax is None:
     _init_inception()
@@ -0,0 +1,90 @@
+"""This module implements an on-disk cache of Inception activation statistics keyed by content hashes"""
+import hashlib
+import os
+
+import numpy as np
+
+
+def hash_files(paths):
+    """Return a content hash of a set of files, independent of their order
+
+    Parameters:
+        paths (list) -- paths of the files, e.g. the images of a dataset
+    """
+    digest = hashlib.sha1()
+    for path in sorted(str(path) for path in paths):
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_state_dict(state_dict, *extra):
+    """Return a content hash of network weights, plus anything else that determines the samples
+
+    Parameters:
+        state_dict (dict) -- network state dict, e.g. netG.state_dict()
+        extra             -- e.g. the sampling seed and the number of samples
+    """
+    digest = hashlib.sha1()
+    for key in sorted(state_dict):
+        digest.update(key.encode())
+        digest.update(state_dict[key].detach().cpu().contiguous().numpy().tobytes())
+    digest.update(repr(extra).encode())
+    return digest.hexdigest()
+
+
+class StatsCache():
+    """This class stores dicts of numpy arrays as <key>.npz files in a directory.
+
+    The directory is bounded to <max_size_mb> megabytes; when it grows larger,
+    the least recently used entries are deleted. Recency is the file modification time,
+    which is refreshed by every hit.
+    """
+
+    def __init__(self, cache_dir, max_size_mb=2048):
+        """Initialize the StatsCache class
+
+        Parameters:
+            cache_dir (str)   -- directory of the cached statistics, created if missing
+            max_size_mb (int) -- size bound of the directory, 0 for no bound
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def get(self, key):
+        """Return the dict of arrays stored under <key>, or None on a miss"""
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                entry = {name: f[name] for name in f.files}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return entry
+
+    def put(self, key, **arrays):
+        """Store the arrays under <key>, then evict the least recently used entries over the size bound"""
+        path = self._path(key)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)  # readers never see a partial entry
+        self.evict()
+
+    def evict(self):
+        if self.max_size <= 0:
+            return
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if name.endswith('.npz') and not name.endswith('.tmp.npz')]
+        entries = sorted((os.stat(path).st_mtime, os.path.getsize(path), path) for path in entries)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:  # always keep the newest entry
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,29 @@
+from unittest import TestCase
+
+import torch
+
+from util.image_pool import ImagePool
+
+
+class ImagePoolTest(TestCase):
+
+    def test_fill_then_swap(self):
+        pool = ImagePool(4)
+        first = torch.arange(4.).view(4, 1)
+        self.assertTrue(torch.equal(pool.query(first), first))  # filling returns the inputs
+        second = torch.arange(4., 12.).view(8, 1)
+        returned = pool.query(second)
+        self.assertEqual(returned.shape, second.shape)
+        # every row is either the input or a stored image, and the stored images stay distinct
+        for row, image in zip(returned.view(-1).tolist(), second.view(-1).tolist()):
+            self.assertIn(row, [image] + list(range(4)))
+        stored = pool.buffers[0].view(-1).tolist()
+        self.assertEqual(len(set(stored)), 4)
+        self.assertEqual(sorted(set(stored) | set(returned.view(-1).tolist())), list(range(12)))
+
+    def test_dict_rows_stay_paired(self):
+        pool = ImagePool(3)
+        for start in range(0, 30, 5):
+            data = torch.arange(start, start + 5.).view(5, 1)
+            returned = pool.query({'data': data, 'condition': data.long().view(-1)})
+            self.assertTrue(torch.equal(returned['data'].view(-1).long(), returned['condition']))
@@ -0,0 +1,22 @@
+import importlib.util
+from unittest import TestCase, skipUnless
+
+import numpy as np
+
+
+@skipUnless(importlib.util.find_spec('tensorflow'), 'the TensorFlow inception score needs tensorflow')
+class InceptionScoreTest(TestCase):
+
+    def test_batched_score_matches_single_images(self):
+        from util.inception import get_inception_score
+        rng = np.random.RandomState(0)
+        images = [rng.randint(0, 256, (32, 32, 3)).astype(np.float32) for _ in range(6)]
+        batched = get_inception_score(images, splits=1, batch_size=4)  # batches of 4 and 2 images
+        single = get_inception_score(images, splits=1, batch_size=1)
+        self.assertAlmostEqual(batched[0], single[0], places=3)
+
+    def test_producer_errors_are_raised(self):
+        from util.inception import _prefetch_batches
+        images = [np.zeros((32, 32, 3)), np.zeros((16, 16, 3))]
+        with self.assertRaises(RuntimeError):
+            list(_prefetch_batches(images, batch_size=2, prefetch=1))
@@ -0,0 +1,32 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from util.stats_cache import StatsCache
+
+
+class StatsCacheTest(TestCase):
+
+    def test_get_put(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = StatsCache(cache_dir)
+            self.assertIsNone(cache.get('a'))
+            cache.put('a', mu=np.arange(4.), sigma=np.eye(4))
+            entry = cache.get('a')
+            self.assertTrue(np.array_equal(entry['mu'], np.arange(4.)))
+            self.assertTrue(np.array_equal(entry['sigma'], np.eye(4)))
+
+    def test_lru_eviction(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = StatsCache(cache_dir, max_size_mb=1)
+            array = np.zeros(400 * 1024 // 8)  # ~400KB per entry
+            for key in ['a', 'b']:
+                cache.put(key, array=array)
+                time.sleep(0.01)
+            cache.get('a')  # 'b' is now the least recently used
+            time.sleep(0.01)
+            cache.put('c', array=array)
+            self.assertEqual(sorted(os.listdir(cache_dir)), ['a.npz', 'c.npz'])